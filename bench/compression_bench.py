@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare the compression codecs and levels of build contexts.
+
+Produces the tarball of the build context of a directory (a copy of
+the sources of this client by default) once, and then sends it through
+`ContextStream` with every codec and level, reporting the raw and wire
+size and the throughput of each::
+
+   $ python bench/compression_bench.py --dir ~/src/app --levels 1,6,9
+
+Codecs that are not available (such as `xz` without
+`backports.lzma`) are skipped.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam_client.context import (BuildContext, ContextStream,
+                                    COMPRESSION_CODECS)
+
+
+_CHUNK_SIZE = 1024 * 1024
+
+
+def measure(chunks, codec, level):
+    """Send `chunks` through a stream with `codec` at `level` and
+    return the stream.
+    """
+    stream = ContextStream(iter(chunks), codec, level)
+    for data in stream:
+        pass
+    return stream
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--dir', help="application root to use as "
+                        "context (defaults to a copy of gilliam_client)")
+    parser.add_argument('--codecs', default=','.join(COMPRESSION_CODECS),
+                        help="comma-separated codecs to try")
+    parser.add_argument('--levels', default='1,6,9',
+                        help="comma-separated levels to try")
+    options = parser.parse_args()
+
+    tmpdir = None
+    if options.dir is None:
+        # tagging writes the file index into the application root.
+        tmpdir = tempfile.mkdtemp(prefix='compression-bench-')
+        source = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'gilliam_client')
+        shutil.copytree(source, os.path.join(tmpdir, 'gilliam_client'),
+                        ignore=shutil.ignore_patterns('*.pyc'))
+    try:
+        context = BuildContext.make(options.dir or tmpdir)
+        context.tag()
+        chunks = list(context.stream(_CHUNK_SIZE))
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+    print "%d files, %d bytes of tarball" % (
+        len(context.entries), sum(len(data) for data in chunks))
+    print "%-6s %5s %12s %12s %7s %9s" % (
+        'codec', 'level', 'raw', 'wire', 'ratio', 'MB/s')
+    levels = [int(level) for level in options.levels.split(',')]
+    for codec in options.codecs.split(','):
+        for level in ([None] if codec == 'none' else levels):
+            try:
+                stream = measure(chunks, codec, level)
+            except ValueError as err:
+                print "%-6s %5s  skipped: %s" % (codec, level, err)
+                continue
+            print "%-6s %5s %12d %12d %6.1f%% %9.1f" % (
+                codec, '-' if level is None else level, stream.raw_bytes,
+                stream.wire_bytes,
+                100.0 * stream.wire_bytes / (stream.raw_bytes or 1),
+                stream.raw_bytes / 1e6 / stream.elapsed
+                if stream.elapsed else float('inf'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Compare `IgnoreMatcher` with the fnmatch loop it replaced.
+
+Generates a mix of ignore patterns (plain names, `*.ext`, `prefix*`
+and character classes) and file names, and filters the names with
+both.  The fnmatch loop tries every pattern against every name, so it
+is only timed on a sample of the names::
+
+   $ python bench/ignore_bench.py --patterns 5000 --files 20000
+
+"""
+
+import argparse
+from fnmatch import fnmatch
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam_client.ignore import IgnoreMatcher
+
+
+def fnmatch_filter(names, patterns):
+    """The filter that was used before `IgnoreMatcher`."""
+    def it():
+        for name in names:
+            for pattern in patterns:
+                if fnmatch(name, pattern) or name == pattern:
+                    break
+            else:
+                yield name
+    return list(it())
+
+
+def make_patterns(count, rand):
+    kinds = (lambda n: 'name%d' % (n,),
+             lambda n: '*.ext%d' % (n,),
+             lambda n: 'tmp%d*' % (n,),
+             lambda n: 'cache[0-9]%d' % (n,))
+    return [rand.choice(kinds)(n) for n in xrange(count)]
+
+
+def make_names(count, patterns, rand):
+    """Return `count` file names, some of which match `patterns`."""
+    names = []
+    for n in xrange(count):
+        kind = rand.randrange(6)
+        k = rand.randrange(len(patterns))
+        if kind == 0:
+            names.append('name%d' % (k,))
+        elif kind == 1:
+            names.append('file%d.ext%d' % (n, k))
+        elif kind == 2:
+            names.append('tmp%d-%d' % (k, n))
+        else:
+            names.append('src%d.py' % (n,))
+    return names
+
+
+def timed(fn, *args):
+    t0 = time.time()
+    result = fn(*args)
+    return result, time.time() - t0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--patterns', type=int, default=2000)
+    parser.add_argument('--files', type=int, default=20000)
+    parser.add_argument('--sample', type=int, default=50,
+                        help="number of files to time the fnmatch "
+                        "loop on")
+    parser.add_argument('--seed', type=int, default=0)
+    options = parser.parse_args()
+
+    rand = random.Random(options.seed)
+    patterns = make_patterns(options.patterns, rand)
+    names = make_names(options.files, patterns, rand)
+    sample = names[:options.sample]
+
+    matcher, compile_time = timed(IgnoreMatcher, patterns)
+    kept, elapsed = timed(matcher.filter, '', names)
+    print "%d patterns, %d files (%d ignored)" % (
+        len(patterns), len(names), len(names) - len(kept))
+    print "IgnoreMatcher: compile %.1fms, %.2fus per file" % (
+        compile_time * 1000, elapsed / len(names) * 1e6)
+
+    old_kept, old_elapsed = timed(fnmatch_filter, sample, patterns)
+    assert old_kept == matcher.filter('', sample), "results differ"
+    print "fnmatch loop:  %.2fus per file (%d files)" % (
+        old_elapsed / len(sample) * 1e6, len(sample))
+    print "speedup: %.0fx" % (
+        (old_elapsed / len(sample)) / (elapsed / len(names))
+        if elapsed else float('inf'),)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time computing the tag of a build context with a cold and a warm
+file index.
+
+Builds a synthetic tree of small files (100k by default) and tags it
+first without `.gilliam/index`, and then again with the index that the
+first run wrote::
+
+   $ python bench/index_bench.py --files 100000
+
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam_client.context import BuildContext
+
+
+def make_tree(rootdir, files, per_dir, size):
+    """Create `files` files of `size` bytes, `per_dir` to a
+    directory.
+    """
+    for n in xrange(files):
+        dirname = os.path.join(rootdir, 'd%d' % (n // per_dir // per_dir),
+                               'd%d' % (n // per_dir))
+        if n % per_dir == 0 and not os.path.isdir(dirname):
+            os.makedirs(dirname)
+        with open(os.path.join(dirname, 'f%d.txt' % (n,)), 'wb') as fp:
+            fp.write(('%d\n' % (n,)) * (size // 8 or 1))
+
+
+def time_tag(rootdir):
+    """Return the tag of `rootdir` and the number of seconds it took
+    to walk and to tag the context.
+    """
+    t0 = time.time()
+    context = BuildContext.make(rootdir)
+    t1 = time.time()
+    tag = context.tag()
+    return tag, t1 - t0, time.time() - t1
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--files', type=int, default=100000)
+    parser.add_argument('--per-dir', type=int, default=100)
+    parser.add_argument('--size', type=int, default=1024,
+                        help="size of each file in bytes")
+    parser.add_argument('--dir', help="create the tree in DIR (it is "
+                        "kept)")
+    parser.add_argument('--runs', type=int, default=3,
+                        help="number of warm runs")
+    options = parser.parse_args()
+
+    rootdir = options.dir or tempfile.mkdtemp(prefix='index-bench-')
+    try:
+        if not os.path.isdir(os.path.join(rootdir, 'd0')):
+            t0 = time.time()
+            make_tree(rootdir, options.files, options.per_dir, options.size)
+            print "created %d files in %.1fs" % (
+                options.files, time.time() - t0)
+            # files modified within the timestamp granularity of the
+            # index are racy and always rehashed.
+            time.sleep(1)
+
+        index = os.path.join(rootdir, '.gilliam', 'index')
+        if os.path.exists(index):
+            os.remove(index)
+        cold, walk, elapsed = time_tag(rootdir)
+        print "cold: walk %.2fs, tag %.2fs" % (walk, elapsed)
+        for run in range(options.runs):
+            warm, walk, warm_elapsed = time_tag(rootdir)
+            assert warm == cold, "tag changed between runs"
+            print "warm: walk %.2fs, tag %.2fs (%.1fx)" % (
+                walk, warm_elapsed, elapsed / warm_elapsed
+                if warm_elapsed else float('inf'))
+    finally:
+        if not options.dir:
+            shutil.rmtree(rootdir)
+
+
+if __name__ == '__main__':
+    main()
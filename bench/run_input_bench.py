@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure how `run` passes input on to a process.
+
+Compares `read_available` with reading stdin a byte at a time, as
+`run` did for a TTY before.  Input is written to a pipe, read by the
+reader under test and sent to a stand-in executor on the loopback
+interface, one frame per chunk like the messages of the attach
+websocket.  The stand-in echoes the input back.
+
+Latency is the round trip of a single keystroke; throughput is that of
+pasting `--size` bytes in writes of 4 KiB::
+
+   $ python bench/run_input_bench.py --keystrokes 1000 --size 1048576
+
+"""
+
+import argparse
+from functools import partial
+import os
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam.util import thread
+
+from gilliam_client.commands.run import read_available
+
+
+_HEADER = struct.Struct('!I')
+
+_READERS = (
+    ('read(1)', lambda fd: iter(partial(
+                os.fdopen(os.dup(fd), 'rb').read, 1), '')),
+    ('read_available', read_available),
+    )
+
+
+def _recv_exactly(sock, size):
+    data = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError()
+        data.append(chunk)
+        size -= len(chunk)
+    return ''.join(data)
+
+
+class StandInExecutor(object):
+    """Accepts one attach connection and echoes back the payload of
+    every frame.
+    """
+
+    def __init__(self):
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.address = self.listener.getsockname()
+        self.frames = 0
+        thread(self._serve)
+
+    def _serve(self):
+        conn, address = self.listener.accept()
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while True:
+                size, = _HEADER.unpack(_recv_exactly(conn, _HEADER.size))
+                data = _recv_exactly(conn, size)
+                self.frames += 1
+                conn.sendall(data)
+        except EOFError:
+            pass
+        finally:
+            conn.close()
+            self.listener.close()
+
+
+def attach(make_reader):
+    """Attach a reader made by `make_reader` to a stand-in executor.
+    Return the write end of its input pipe, the socket that the echo
+    comes back on, the executor and a function that waits for the
+    reader to finish once the pipe is closed.
+    """
+    executor = StandInExecutor()
+    sock = socket.create_connection(executor.address)
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    r, w = os.pipe()
+
+    def send():
+        for data in make_reader(r):
+            sock.sendall(_HEADER.pack(len(data)) + data)
+        sock.shutdown(socket.SHUT_WR)
+
+    sender = thread(send)
+
+    def join():
+        sender.join()
+        os.close(r)
+        sock.close()
+    return w, sock, executor, join
+
+
+def latency(make_reader, count):
+    """Return the sorted round trips of `count` keystrokes."""
+    w, sock, executor, join = attach(make_reader)
+    times = []
+    try:
+        for n in xrange(count):
+            t0 = time.time()
+            os.write(w, 'x')
+            _recv_exactly(sock, 1)
+            times.append(time.time() - t0)
+    finally:
+        os.close(w)
+        join()
+    return sorted(times)
+
+
+def throughput(make_reader, size):
+    """Paste `size` bytes and return the number of seconds until they
+    all came back, and the number of frames that they were sent in.
+    """
+    w, sock, executor, join = attach(make_reader)
+    block = 'x' * 4096
+
+    def paste():
+        for n in xrange(size // len(block)):
+            os.write(w, block)
+        os.close(w)
+
+    t0 = time.time()
+    thread(paste)
+    received = 0
+    while True:
+        data = sock.recv(65536)
+        if not data:
+            break
+        received += len(data)
+    elapsed = time.time() - t0
+    join()
+    return elapsed, executor.frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--keystrokes', type=int, default=1000)
+    parser.add_argument('--size', type=int, default=1024 * 1024,
+                        help="number of bytes to paste")
+    options = parser.parse_args()
+
+    for name, make_reader in _READERS:
+        times = latency(make_reader, options.keystrokes)
+        elapsed, frames = throughput(make_reader, options.size)
+        print ("%-15s keystroke median %6.1fus  p99 %6.1fus  "
+               "paste %7.1f MB/s in %d frames" % (
+                name, times[len(times) // 2] * 1e6,
+                times[int(len(times) * 0.99)] * 1e6,
+                options.size / 1e6 / elapsed, frames))
+
+
+if __name__ == '__main__':
+    main()
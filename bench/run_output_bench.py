@@ -0,0 +1,218 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Measure how fast `run` streams the output of a process.
+
+A stand-in executor on the loopback interface sends `--size` bytes
+(1 GB by default) of output in frames of `--frame-size` bytes, like
+the messages of the attach websocket.  Every frame is written to a
+file, either through an `OutputSink` set up the way `run` does when
+its output is not a TTY (or is, with `--tty`), or straight to an
+unbuffered file as `run` did before::
+
+   $ python bench/run_output_bench.py --size 1000000000 --out /tmp/out
+
+The `network` output drops the frames, which gives the rate that the
+client can receive at.  Reports the throughput, the number of writes
+to the file, and the peak memory use.  Each output is measured in a
+process of its own.
+"""
+
+import argparse
+import os
+import resource
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from gilliam.util import thread
+
+from gilliam_client.commands.run import OutputSink
+
+
+_HEADER = struct.Struct('!I')
+
+
+def _recv_exactly(sock, size):
+    data = []
+    while size:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError()
+        data.append(chunk)
+        size -= len(chunk)
+    return ''.join(data)
+
+
+class StandInExecutor(object):
+    """Sends `size` bytes of output to the first connection, in frames
+    of `frame_size` bytes.
+    """
+
+    def __init__(self, size, frame_size):
+        self.size = size
+        self.frame_size = frame_size
+        self.listener = socket.socket()
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.address = self.listener.getsockname()
+        thread(self._serve)
+
+    def _serve(self):
+        conn, address = self.listener.accept()
+        frame = _HEADER.pack(self.frame_size) + 'x' * self.frame_size
+        try:
+            for n in xrange(self.size // self.frame_size):
+                conn.sendall(frame)
+        finally:
+            conn.close()
+            self.listener.close()
+
+
+# options of the sink that `run` writes output to, when it is not a
+# TTY and when it is.
+_SINK_OPTIONS = {False: {'size': 1 << 20, 'idle': 0.05},
+                 True: {'size': 65536, 'idle': 0.005}}
+
+
+class NullOutput(object):
+    """Output that drops what is written to it."""
+
+    writes = 0
+
+    def __init__(self, fd):
+        os.close(fd)
+
+    def write(self, data):
+        pass
+
+    def close(self):
+        pass
+
+
+class CountingFile(object):
+    """Unbuffered file that counts its writes."""
+
+    def __init__(self, fd):
+        self.fp = os.fdopen(fd, 'w', 0)
+        self.writes = 0
+
+    def write(self, data):
+        self.writes += 1
+        self.fp.write(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.fp.close()
+
+
+class CountingSink(OutputSink):
+    """`OutputSink` that counts its writes."""
+
+    writes = 0
+    tty = False
+
+    def __init__(self, fd):
+        OutputSink.__init__(self, fd, **_SINK_OPTIONS[self.tty])
+
+    def _write(self, data):
+        self.writes += 1
+        OutputSink._write(self, data)
+
+    def close(self):
+        OutputSink.close(self)
+        os.close(self.fd)
+
+
+def stream(make_output, path, size, frame_size):
+    """Stream `size` bytes from a stand-in executor to an output made
+    by `make_output` from a descriptor of `path`.  Return the number
+    of seconds it took and the output.
+    """
+    executor = StandInExecutor(size, frame_size)
+    sock = socket.create_connection(executor.address)
+    output = make_output(os.open(path, os.O_WRONLY | os.O_CREAT
+                                 | os.O_TRUNC))
+    t0 = time.time()
+    try:
+        while True:
+            try:
+                header = _recv_exactly(sock, _HEADER.size)
+            except EOFError:
+                break
+            size, = _HEADER.unpack(header)
+            output.write(_recv_exactly(sock, size))
+    finally:
+        sock.close()
+        output.close()
+    return time.time() - t0, output
+
+
+_OUTPUTS = {'network': NullOutput, 'unbuffered': CountingFile,
+            'sink': CountingSink}
+
+
+def _maxrss():
+    # kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size', type=int, default=1000 * 1000 * 1000,
+                        help="bytes of output to stream")
+    parser.add_argument('--frame-size', type=int, default=4096)
+    parser.add_argument('--out', metavar='PATH',
+                        help="file to write to (defaults to a "
+                        "temporary file)")
+    parser.add_argument('--tty', action='store_true',
+                        help="set up the sink as for a TTY")
+    parser.add_argument('--output', choices=sorted(_OUTPUTS),
+                        help="only measure OUTPUT, in this process")
+    options = parser.parse_args()
+
+    if options.output is None:
+        path = options.out
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix='run-output-bench-')
+            os.close(fd)
+        try:
+            for name in ('network', 'unbuffered', 'sink'):
+                subprocess.check_call(
+                    [sys.executable, __file__, '--output', name,
+                     '--out', path, '--size', str(options.size),
+                     '--frame-size', str(options.frame_size)]
+                    + (['--tty'] if options.tty else []))
+        finally:
+            if options.out is None:
+                os.remove(path)
+        return
+    CountingSink.tty = options.tty
+    elapsed, output = stream(_OUTPUTS[options.output], options.out,
+                             options.size, options.frame_size)
+    print "%-10s %8.1f MB/s  %8d writes  peak rss %d KB" % (
+        options.output, options.size / 1e6 / elapsed, output.writes,
+        _maxrss())
+
+
+if __name__ == '__main__':
+    main()
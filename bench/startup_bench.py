@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Time how long the command-line tool takes to start.
+
+Runs `gilliam-cli --help` and `gilliam-cli ps --help` in fresh
+interpreters and reports the best and median wall time of each, and
+how much of it is spent over starting a bare interpreter::
+
+   $ python bench/startup_bench.py --runs 20
+
+With `--max-ms`, exits non-zero if the median time over a bare
+interpreter of any of the commands is above the budget.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+
+_COMMANDS = (('--help',), ('ps', '--help'))
+
+
+def time_run(argv, env, runs):
+    """Run `argv` `runs` times and return the sorted wall times in
+    seconds.
+    """
+    times = []
+    with open(os.devnull, 'w') as devnull:
+        for run in range(runs):
+            t0 = time.time()
+            subprocess.check_call(argv, stdout=devnull, env=env)
+            times.append(time.time() - t0)
+    return sorted(times)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--max-ms', type=float, metavar='MS',
+                        help="fail if a command takes more than MS "
+                        "milliseconds over a bare interpreter")
+    options = parser.parse_args()
+
+    rootdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    script = os.path.join(rootdir, 'bin', 'gilliam-cli')
+    env = dict(os.environ)
+    env['PYTHONPATH'] = os.pathsep.join(
+        [rootdir] + filter(None, [env.get('PYTHONPATH')]))
+
+    bare = time_run([sys.executable, '-c', 'pass'], env, options.runs)
+    base = bare[len(bare) // 2]
+    print "%-24s best %6.1fms  median %6.1fms" % (
+        'python -c pass', bare[0] * 1000, base * 1000)
+    slow = []
+    for args in _COMMANDS:
+        name = ' '.join(('gilliam-cli',) + args)
+        times = time_run([sys.executable, script] + list(args), env,
+                         options.runs)
+        median = times[len(times) // 2]
+        print "%-24s best %6.1fms  median %6.1fms  (+%.1fms)" % (
+            name, times[0] * 1000, median * 1000, (median - base) * 1000)
+        if (options.max_ms is not None
+                and (median - base) * 1000 > options.max_ms):
+            slow.append(name)
+    if slow:
+        sys.exit("over %gms: %s" % (options.max_ms, ', '.join(slow)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Check that starting the command-line tool stays cheap.
+
+Importing `gilliam_client.cli` and setting up the parsers of all
+commands must not import `requests`, `yaml` or any of the command
+modules; those are only imported once a command is dispatched.  Also
+checks that the synopses in `gilliam_client.commands.COMMANDS`, which
+the parsers are set up from, match the `synopsis` of the commands.
+Exits non-zero, listing the offending modules or commands::
+
+   $ python bench/startup_check.py
+
+"""
+
+import os
+import subprocess
+import sys
+
+
+# modules that may only be imported after dispatch.
+_HEAVY_MODULES = ('requests', 'yaml')
+
+_PROBE = """
+import argparse
+import sys
+from gilliam_client import cli, commands
+list(cli._init_commands(argparse.ArgumentParser()))
+heavy = set(%r + tuple('gilliam_client.commands.' + name
+                       for (name, synopsis) in commands.COMMANDS))
+for name, module in sorted(sys.modules.items()):
+    if module is not None and (name in heavy
+                               or name.split('.')[0] in heavy):
+        print name
+"""
+
+
+def check_synopses():
+    """Return the names of commands whose synopsis in `COMMANDS`
+    differs from the `synopsis` of their `Command` class.
+    """
+    from gilliam_client import commands
+    return [name for (name, synopsis) in commands.COMMANDS
+            if commands.load_command(name).synopsis != synopsis]
+
+
+def main():
+    rootdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    # a fresh interpreter, so that nothing is imported already.
+    output = subprocess.check_output(
+        [sys.executable, '-c', _PROBE % (_HEAVY_MODULES,)], cwd=rootdir)
+    loaded = output.split()
+    if loaded:
+        sys.exit("imported before dispatch: %s" % (', '.join(loaded),))
+    print "ok: no heavy modules imported before dispatch"
+    sys.path.insert(0, rootdir)
+    stale = check_synopses()
+    if stale:
+        sys.exit("synopsis out of sync: %s" % (', '.join(stale),))
+    print "ok: synopses in sync"
+
+
+if __name__ == '__main__':
+    main()
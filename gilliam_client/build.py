@@ -13,12 +13,35 @@
 # limitations under the License.
 
 import getpass
+import itertools
+import logging
 import os
+import Queue
+import random
 import sys
+import threading
 import time
 
+from gilliam.util import thread
+
+from gilliam_client import trace, util
 from gilliam_client.services import detect
-from gilliam_client.errors import ConflictError
+from gilliam_client.errors import ConflictError, CancelledError
+from gilliam_client.rollout import Rollout, RolloutError
+from gilliam_client.watch import InstanceWatch, changed, migrated
+
+
+log = logging.getLogger(__name__)
+
+# How many times to try to create a release, and how long to wait
+# between attempts (see `_backoff`).
+_RELEASE_ATTEMPTS = 10
+_RELEASE_BACKOFF_BASE = 0.1
+_RELEASE_BACKOFF_CAP = 5
+
+# longest time to wait for the formation to change and settle between
+# batches of a migration.
+_MIGRATE_TIMEOUT = 60
 
 
 def create_services(defn):
@@ -32,13 +55,61 @@ def create_services(defn):
     return services
 
 
-def _build_services(config, services, push_images):
-    release = {}
-    options = dict(push_images=push_images)
-    for name, service in services.items():
-        release[name] = service.build(config, **options)
+def _build_services(config, services, push_images, jobs=1, push_jobs=None,
+                    current=None, check_registry=False, rebuild=False,
+                    build_options=None):
+    """Build and commit `services`.
+
+    Services whose image is already part of the `current` release (or,
+    if `check_registry` is true, already is in the registry) are not
+    rebuilt unless `rebuild` is true.  `build_options` are passed on
+    to the `build` of every service.
+
+    Each service is pushed as soon as its build has finished.  At most
+    `jobs` builds and `push_jobs` pushes run at the same time.  If a
+    build or push fail, work that has not yet been started is
+    cancelled and the error is raised immediately.  Returns when all
+    services have been committed.
+    """
+    if push_jobs is None:
+        push_jobs = jobs
+    cancel = threading.Event()
+    options = dict(push_images=push_images, cancel=cancel,
+                   parallel=max(jobs, push_jobs) > 1, current=current,
+                   check_registry=check_registry, rebuild=rebuild)
+    options.update(build_options or {})
+    build_semaphore = threading.BoundedSemaphore(max(jobs, 1))
+    push_semaphore = threading.BoundedSemaphore(max(push_jobs, 1))
+    results = Queue.Queue()
+
+    def _step(semaphore, name, fn):
+        with semaphore:
+            if cancel.is_set():
+                raise CancelledError(name)
+            try:
+                return fn(config, **options)
+            except BaseException:
+                cancel.set()
+                raise
+
+    def _build(name, service):
+        try:
+            defn = _step(build_semaphore, name, service.build)
+            _step(push_semaphore, name, service.commit)
+        except BaseException:
+            results.put((name, None, sys.exc_info()))
+        else:
+            results.put((name, defn, None))
+
     for name, service in services.items():
-        service.commit(config, **options)
+        thread(_build, name, service)
+
+    release = {}
+    for _ in services:
+        name, defn, exc_info = results.get(True, 2**31)
+        if exc_info is not None:
+            raise exc_info[0], exc_info[1], exc_info[2]
+        release[name] = defn
     return release
 
 
@@ -58,35 +129,113 @@ def merge_releases(current, services):
     return services
 
 
-def _last_release(config, scheduler):
-    releases = list(scheduler.releases(config.formation))
-    if not releases:
-        return None
-    releases.sort(key=lambda release: int(release['name']))
-    return releases[-1]
+def _latest_release(config, scheduler, current=None):
+    """Find the latest release by probing for the releases that follow
+    `current`.  If there is no `current` release to start from, the
+    scheduler client starts from its release cache, and only lists
+    the releases if it has no usable cache.
+    """
+    if current is None:
+        return scheduler.latest_release(config.formation)
+    latest = current
+    while True:
+        release = scheduler.release(config.formation, _name_release(latest))
+        if release is None:
+            return latest
+        latest = release
+
+
+def _backoff(attempt):
+    """Return number of seconds to wait before making attempt number
+    `attempt` (counting from zero) to create a release again.
+    """
+    return random.uniform(0, min(_RELEASE_BACKOFF_CAP,
+                                 _RELEASE_BACKOFF_BASE * 2 ** attempt))
 
 
 def release(config, scheduler, services, author=None, message='',
-            override_env=False, push_images=True):
-    built_services = _build_services(config, services, push_images)
-    while True:
-        current = _last_release(config, scheduler)
+            override_env=False, push_images=True, jobs=1,
+            push_jobs=None, check_registry=False, rebuild=False,
+            build_options=None):
+    current = _latest_release(config, scheduler)
+    built_services = _build_services(
+        config, services, push_images, jobs, push_jobs,
+        current=current, check_registry=check_registry, rebuild=rebuild,
+        build_options=build_options)
+    # releases might have been created while we were building.
+    current = _latest_release(config, scheduler, current)
+    for conflicts in range(_RELEASE_ATTEMPTS):
+        name = _name_release(current)
         try:
-            response = scheduler.create_release(
-                config.formation, _name_release(current),
-                author or getpass.getuser(), message,
-                built_services if override_env else merge_releases(
-                    current, built_services))
+            with trace.span('create release', release=name,
+                            attempt=conflicts):
+                response = scheduler.create_release(
+                    config.formation, name,
+                    author or getpass.getuser(), message,
+                    built_services if override_env else merge_releases(
+                        current, built_services))
         except ConflictError:
-            continue
+            log.debug("release %s already exists" % (name,))
+            if conflicts + 1 < _RELEASE_ATTEMPTS:
+                time.sleep(_backoff(conflicts))
+                current = _latest_release(config, scheduler, current)
         else:
+            if conflicts:
+                log.info("release %s created after %d conflicts" % (
+                        response['name'], conflicts))
             return response['name']
-
-
-def migrate(config, scheduler, release, rate):
-    while True:
-        more = scheduler.migrate(config.formation, release)
-        if not more:
-            break
+    sys.exit("could not create release: %d conflicts" % (
+            _RELEASE_ATTEMPTS,))
+
+
+def _migrate(config, scheduler, release, rate, watch):
+    throttle = util.Throttle(rate)
+    for step in itertools.count():
+        throttle.wait()
+        before = watch.snapshot()
+        with trace.span('migrate step', release=release,
+                        step=step) as args:
+            more = args['more'] = scheduler.migrate(config.formation,
+                                                    release)
+            if not more:
+                break
+            # wait for the batch to take effect before starting the
+            # next one.
+            watch.wait(changed(before), _MIGRATE_TIMEOUT, refresh=True)
+
+
+def migrate(config, scheduler, release, rate, wait=False,
+            max_surge=None, max_unavailable=None, batch_size=None):
+    """Migrate the formation to `release`, one batch at a time.
+
+    After each batch, wait for the instances of the formation to
+    change and settle, but no longer than a minute, before the next
+    batch is started.  Batches are started at least `rate` seconds
+    apart.
+
+    If any of `max_surge`, `max_unavailable` and `batch_size` is
+    given, the client rolls out the release itself instead, see
+    `gilliam_client.rollout`.  `rate` is then the least time between
+    its steps.
+
+    :param wait: (Optional) If true, do not return until every
+        instance of the formation runs `release`.
+    """
+    watch = InstanceWatch(scheduler, config.formation)
+    try:
+        if (max_surge, max_unavailable, batch_size) != (None, None, None):
+            rollout = Rollout(
+                scheduler, config.registry_client, config.formation,
+                release, max_surge=max_surge,
+                max_unavailable=max_unavailable, batch_size=batch_size,
+                rate=rate)
+            try:
+                rollout.run()
+            except (RolloutError, ValueError), err:
+                sys.exit("cannot roll out release %s: %s" % (release, err))
         else:
-            time.sleep(rate)
+            _migrate(config, scheduler, release, rate, watch)
+        if wait:
+            watch.wait(migrated(release))
+    finally:
+        watch.close()
@@ -12,3 +12,123 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+
+"""Drive a build on an executor.
+
+This mirrors `gilliam.BuilderClient.build`, but verifies the build
+context after it has been uploaded and before the result is committed
+as an image, so that an image is never tagged with a tag that does
+not match the uploaded content.  A build that is cancelled is stopped
+on the executor and never committed.
+
+Builders advertise what they support beyond a plain tarball in the
+`capabilities` list of the service registry entry of their executor.
+A builder with the `context-delta` capability (`CAP_DELTA`) accepts a
+context that only holds the changed files, together with a
+`DELTA_PATH` member listing the removed ones.  It applies them on top
+of the image named by `GILLIAM_CONTEXT_BASE`, or exits with
+`EX_NOBASE` if it does not have that image.  Other builders would
+build the partial context as is, so they are always sent everything.
+
+Likewise, the context is only compressed with a codec if the builder
+has the `context-<codec>` capability (such as `context-gzip`), and
+then the codec is passed in `GILLIAM_CONTEXT_COMPRESSION`.
+"""
+
+import logging
+import threading
+
+from gilliam.util import thread
+
+from . import trace
+
+
+log = logging.getLogger(__name__)
+
+# how often to check if a build was cancelled, in seconds.
+_CANCEL_INTERVAL = 0.5
+
+# Exit code of the builder if it was given a delta context but do not
+# have the base image to apply it to (EX_TEMPFAIL).
+EX_NOBASE = 75
+
+# Path of the description of a delta context within the tarball.
+DELTA_PATH = '.gilliam/delta'
+
+# Capability of builders that take delta contexts.
+CAP_DELTA = 'context-delta'
+
+
+def compression_capability(codec):
+    """Return the capability of builders that take contexts
+    compressed with `codec`.
+    """
+    return 'context-%s' % (codec,)
+
+
+def supports(executor, capability):
+    """Return true if the builder of `executor`, a service registry
+    entry, advertises `capability`.
+    """
+    return capability in (executor.get('capabilities') or ())
+
+
+class ContextChangedError(Exception):
+    """Files in the build context changed while it was uploaded."""
+
+
+def _stop(process):
+    """Stop `process` by deleting it on the executor."""
+    try:
+        response = process.client.delete(process._url)
+        response.raise_for_status()
+    except Exception:
+        log.warning("could not stop builder", exc_info=True)
+
+
+def _stop_on_cancel(process, cancel, done):
+    """Stop `process` if `cancel` is set before `done` is."""
+    while not done.is_set():
+        if cancel.wait(_CANCEL_INTERVAL):
+            _stop(process)
+            return
+
+
+def build(executor, repository, tag, infile, output, context=None,
+          env=None, cancel=None, formation='builder', image='gilliam/base'):
+    """Run the builder on `executor`, feeding it the tarball read
+    from `infile`, and commit the result as `repository:tag`.
+
+    :param context: (Optional) The `BuildContext` that `infile` was
+        produced from.  The image is only committed if no files of
+        the context changed while they were uploaded.
+
+    :param env: (Optional) Environment variables for the builder.
+
+    :param cancel: (Optional) `threading.Event` that is set when the
+        build should be aborted.  The builder is then stopped, and
+        its result is not committed.
+
+    :raises: ContextChangedError if files changed during the upload.
+    :returns: The exit code of the builder.
+    """
+    with trace.span('builder run', repository=repository) as args:
+        process = executor.run(formation, image, env or {},
+                               ['/build/builder'])
+        thread(process.attach, infile, output)
+        if cancel is not None:
+            done = threading.Event()
+            thread(_stop_on_cancel, process, cancel, done)
+        try:
+            result = args['exit_code'] = process.wait()
+        finally:
+            if cancel is not None:
+                done.set()
+    if cancel is not None and cancel.is_set():
+        return result
+    if result == 0:
+        if context is not None and context.changed:
+            raise ContextChangedError(', '.join(context.changed))
+        with trace.span('commit image', repository=repository, tag=tag):
+            process.commit(repository, tag)
+    return result
@@ -0,0 +1,171 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Output of builds.
+
+Output of the builder is split into lines, which are logged to the
+console and, if a log directory is given, written to a file per
+service and build::
+
+   <log dir>/<service>-<YYYYmmddTHHMMSS>.log
+
+Lines in the file are prefixed with the time they were received.  In
+the `jsonl` format every line is instead a JSON object with `time`,
+`service` and `line`.
+
+Lines are logged to the console at the level given by the
+`build_log_level` stage variable.  If that level is not shown (for
+example with `--quiet`), the last lines are kept so that they can be
+shown if the build fails.
+"""
+
+from collections import deque
+import errno
+import json
+import logging
+import os
+import time
+
+
+LOG_FORMATS = ('plain', 'jsonl')
+
+_LOG_SUFFIXES = {'plain': '.log', 'jsonl': '.jsonl'}
+
+
+class LineSplitter(object):
+    """Incremental splitter of data into lines.
+
+    Data is collected in a buffer; complete lines are sliced out of it
+    as they come in, and only the trailing partial line is kept.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        """Add `data` and return the lines that it completed, without
+        line endings.
+        """
+        buf = self.buffer
+        start = len(buf)
+        buf.extend(data)
+        lines, pos = [], 0
+        end = buf.find('\n', start)
+        while end != -1:
+            lines.append(str(buf[pos:end].rstrip('\r')))
+            pos = end + 1
+            end = buf.find('\n', pos)
+        if pos:
+            del buf[:pos]
+        return lines
+
+    def close(self):
+        """Return what is left of the last line, or `None`."""
+        line, self.buffer = self.buffer, bytearray()
+        return str(line) if line else None
+
+
+def _format_time(t):
+    return '%s.%03d' % (time.strftime('%Y-%m-%dT%H:%M:%S',
+                                      time.localtime(t)),
+                        int(t * 1000) % 1000)
+
+
+class BuildLog(object):
+    """File-like object that the output of a build is written to.
+
+    :param log: Logger to log lines to.
+
+    :param indent: Prefix of lines that are logged.
+
+    :param level: Level to log lines at.
+
+    :param fp: (Optional) File to also write lines to, in `format`.
+
+    :param tail: Number of lines to keep when lines at `level` are not
+        logged.
+    """
+
+    def __init__(self, log, indent, service, level=logging.INFO, fp=None,
+                 format='plain', tail=50, clock=time):
+        self.log = log
+        self.indent = indent
+        self.service = service
+        self.level = level
+        self.fp = fp
+        self.format = format
+        self.clock = clock
+        self.splitter = LineSplitter()
+        self.lines = (None if log.isEnabledFor(level)
+                      else deque(maxlen=tail))
+
+    def _file_line(self, t, line):
+        if self.format == 'jsonl':
+            return json.dumps({'time': t, 'service': self.service,
+                               'line': line.decode('utf-8', 'replace')},
+                              separators=(',', ':')) + '\n'
+        return '%s %s\n' % (_format_time(t), line)
+
+    def _emit(self, lines):
+        if self.fp is not None:
+            t = self.clock.time()
+            self.fp.write(''.join(self._file_line(t, line)
+                                  for line in lines))
+        if self.lines is not None:
+            self.lines.extend(lines)
+        else:
+            for line in lines:
+                self.log.log(self.level, self.indent + line)
+
+    def write(self, data):
+        lines = self.splitter.feed(data)
+        if lines:
+            self._emit(lines)
+
+    def flush(self):
+        if self.fp is not None:
+            self.fp.flush()
+
+    def tail(self):
+        """Return the last lines that were not logged."""
+        return list(self.lines or ())
+
+    def close(self):
+        """Write out the last partial line and close the file."""
+        line = self.splitter.close()
+        if line is not None:
+            self._emit([line])
+        if self.fp is not None:
+            self.fp.close()
+            self.fp = None
+
+    @classmethod
+    def make(cls, log, indent, service, level=logging.INFO, log_dir=None,
+             format='plain', tail=50):
+        """Create a log for a build of `service`, writing to a new file
+        in `log_dir` if it is given.
+        """
+        fp = None
+        if log_dir is not None:
+            if format not in _LOG_SUFFIXES:
+                raise ValueError("unknown build log format: %s" % (format,))
+            try:
+                os.makedirs(log_dir)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+            fp = open(os.path.join(log_dir, '%s-%s%s' % (
+                        service, time.strftime('%Y%m%dT%H%M%S'),
+                        _LOG_SUFFIXES[format])), 'a')
+        return cls(log, indent, service, level, fp, format, tail)
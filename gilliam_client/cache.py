@@ -0,0 +1,170 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Local cache of release documents.
+
+A release never changes after it has been created, so once the client
+has seen a release it can keep it around.  The cache lives in
+`~/.gilliam/cache/<stage>/<formation>/releases` and holds every
+release of the formation that the client has fetched.
+
+The cache directory as a whole is bounded in size; when it grows too
+large the caches of the formations that were least recently used are
+removed.
+"""
+
+import errno
+import json
+import os
+
+
+_CACHE_VERSION = 1
+
+_FILENAME = 'releases'
+
+# default upper bound of the size of the cache directory.
+MAX_CACHE_SIZE = 32 * 1024 * 1024
+
+
+class ReleaseCache(object):
+    """The cached releases of a formation::
+
+       >>> cache = ReleaseCache.make(basedir, 'my-formation')
+       >>> cache.latest()
+       {'name': '12', ...}
+       >>> cache.add(release)
+       >>> cache.write()
+
+    """
+
+    def __init__(self, path, max_size=MAX_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+        self.releases = {}
+        self._dirty = False
+
+    def __len__(self):
+        return len(self.releases)
+
+    def latest(self):
+        """Return the cached release with the highest name, or `None`
+        if the cache is empty.
+        """
+        if not self.releases:
+            return None
+        return self.releases[max(self.releases, key=int)]
+
+    def get(self, name):
+        """Return cached release `name` or `None`."""
+        return self.releases.get(name)
+
+    def sorted(self):
+        """Return all cached releases, ordered by name."""
+        return [self.releases[name] for name in
+                sorted(self.releases, key=int)]
+
+    def add(self, release):
+        """Put `release` in the cache."""
+        if self.releases.get(release['name']) != release:
+            self.releases[release['name']] = release
+            self._dirty = True
+
+    def clear(self):
+        """Forget all cached releases."""
+        self.releases = {}
+        self._dirty = True
+
+    def _read(self):
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return
+        except ValueError:
+            return
+        if data.get('version') != _CACHE_VERSION:
+            return
+        self.releases = data.get('releases', {})
+        # the modification time is what eviction goes by.
+        try:
+            os.utime(self.path, None)
+        except OSError:
+            pass
+
+    def write(self):
+        """Write the cache to disk if it was changed, and evict other
+        formations if the cache directory grew too large.
+        """
+        if not self._dirty:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        tmp = '%s.%d' % (self.path, os.getpid())
+        # releases hold the environment of services, which often has
+        # secrets in it; keep them to the user.
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0600)
+        with os.fdopen(fd, 'w') as fp:
+            json.dump({'version': _CACHE_VERSION,
+                       'releases': self.releases},
+                      fp, separators=(',', ':'))
+        os.rename(tmp, self.path)
+        self._dirty = False
+        basedir = os.path.dirname(os.path.dirname(
+                os.path.dirname(self.path)))
+        evict(basedir, self.max_size, keep=self.path)
+
+    @classmethod
+    def make(cls, basedir, stage, formation, max_size=MAX_CACHE_SIZE):
+        """Read the cached releases of `formation` in `stage`."""
+        cache = cls(os.path.join(basedir, stage or 'default', formation,
+                                 _FILENAME), max_size)
+        cache._read()
+        return cache
+
+
+def evict(basedir, max_size, keep=None):
+    """Remove the least recently used caches in `basedir` until the
+    total size of the caches is at most `max_size` bytes.
+
+    :param keep: (Optional) Path of a cache that should not be
+        removed.
+    """
+    caches, total = [], 0
+    for (dirpath, dirnames, filenames) in os.walk(basedir):
+        if _FILENAME not in filenames:
+            continue
+        path = os.path.join(dirpath, _FILENAME)
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        caches.append((st.st_mtime, st.st_size, path))
+        total += st.st_size
+
+    for (mtime, size, path) in sorted(caches):
+        if total <= max_size:
+            break
+        if path == keep:
+            continue
+        try:
+            os.unlink(path)
+        except OSError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        total -= size
@@ -19,7 +19,7 @@ import textwrap
 import logging
 
 from .config import Config, StageConfig, FormationConfig, AuthConfig
-from . import commands, util
+from . import commands, startup, trace, util
 
 
 _DEBUG_FORMAT = '%(name)s [%(levelname)s]: %(message)s'
@@ -28,6 +28,20 @@ _NORMAL_FORMAT = '%(message)s'
 
 def main():
     """Main entry point for the command-line tool."""
+    # imports happen while the arguments are parsed, so profiling has
+    # to start before that.
+    if '--profile-startup' in sys.argv[1:]:
+        startup.enable()
+        try:
+            _main()
+        finally:
+            startup.disable()
+            startup.report(sys.stderr)
+    else:
+        _main()
+
+
+def _main():
     parser = argparse.ArgumentParser(prog='gilliam-cli', formatter_class=argparse.RawDescriptionHelpFormatter)
     parser.add_argument('-s', '--stage', metavar='STAGE', dest='stage')
     parser.add_argument('-f', '--formation', metavar='NAME', dest='formation',
@@ -36,9 +50,14 @@ def main():
                         action='store_true', default=False)
     parser.add_argument('-D', '--debug', action='store_true')
     parser.add_argument('--verbose', action='store_true')
-    cmds = dict(_init_commands(parser))
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="Do not use the local caches")
+    parser.add_argument('--profile-startup', action='store_true',
+                        help="Print where time is spent starting up")
+    parsers = dict(_init_commands(parser))
 
-    options = parser.parse_args()
+    with startup.timed('parse arguments'):
+        options = parser.parse_args()
     logging.basicConfig(
         stream=sys.stdout,
         level=(logging.DEBUG if options.debug else
@@ -69,9 +88,10 @@ def main():
         None)
 
     try:
-        stage_config = (
-            StageConfig.make(options.stage) if options.stage else
-            StageConfig.default())
+        with startup.timed('read stage config'):
+            stage_config = (
+                StageConfig.make(options.stage) if options.stage else
+                StageConfig.default())
     except EnvironmentError as err:
         sys.exit("%s: %s: cannot read stage config: %s" % (
                 options.cmd, options.stage, err))
@@ -79,20 +99,56 @@ def main():
     auth_path = os.path.expanduser('~/.gilliam/auth')
     auth_config = AuthConfig.make(auth_path)
 
+    cache_dir = (os.path.expanduser('~/.gilliam/cache') if options.cache
+                 else None)
+
     config = Config(
         project_dir, stage_config, form_config, auth_config,
-        options.stage, options.formation)
+        options.stage, options.formation, cache_dir)
                          
-    cmd = cmds[options.cmd]
-    cmd.handle(config, options)
+    cmd = parsers[options.cmd].command
+    trace_path = getattr(options, 'trace', None)
+    if trace_path:
+        trace.enable()
+    try:
+        with startup.timed('run command'):
+            with trace.span(options.cmd, stage=options.stage,
+                            formation=options.formation):
+                cmd.handle(config, options)
+    finally:
+        config.close()
+        if trace_path:
+            try:
+                trace.write(trace_path)
+            except EnvironmentError as err:
+                sys.stderr.write("%s: cannot write trace: %s\n" % (
+                        trace_path, err))
+
+
+class _LazyParser(argparse.ArgumentParser):
+    """Parser of a subcommand that imports the command and lets it
+    add its arguments only when the subcommand is used.
+    """
+
+    def __init__(self, command_name=None, **kwargs):
+        argparse.ArgumentParser.__init__(self, **kwargs)
+        self.command_name = command_name
+        self.command = None
+
+    def parse_known_args(self, args=None, namespace=None):
+        if self.command is None:
+            cls = commands.load_command(self.command_name)
+            self.description = textwrap.dedent(cls.__doc__)
+            self.command = cls(self)
+        return argparse.ArgumentParser.parse_known_args(
+            self, args, namespace)
 
     
 def _init_commands(parser):
     """Initialize the commands."""
-    subparsers = parser.add_subparsers(title='subcommands', dest='cmd')
-    for name, cls in commands.load():
-        cmd = cls(subparsers.add_parser(
-                name, help=cls.synopsis,
-                description=textwrap.dedent(cls.__doc__),
-                formatter_class=argparse.RawDescriptionHelpFormatter))
-        yield name, cmd
+    subparsers = parser.add_subparsers(title='subcommands', dest='cmd',
+                                       parser_class=_LazyParser)
+    for name, synopsis in commands.COMMANDS:
+        yield name, subparsers.add_parser(
+            name, command_name=name, help=synopsis,
+            formatter_class=argparse.RawDescriptionHelpFormatter)
@@ -12,17 +12,25 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
-
-
-def _iter():
-    for fn in os.listdir(os.path.dirname(__file__)):
-        if not fn.endswith('.py') or fn[0] == '.':
-            continue
-        if fn in ('__init__.py',):
-            continue
-        mn, pyext = fn.split('.', 1)
-        yield mn
+# Name and synopsis of every command.  The module of a command is only
+# imported when the command is run (or its help is asked for), so
+# keep this in sync with the `synopsis` of the `Command` classes.
+COMMANDS = (
+    ('auth', 'Authenticate against a registry'),
+    ('build', 'Build a new release of the formation'),
+    ('create', "create new formation"),
+    ('deploy', 'Build a release and migrate to it'),
+    ('index', 'Verify or rebuild the file index'),
+    ('launch', 'Launch a formation from a release manifest'),
+    ('migrate', 'Migrate the formation to a release'),
+    ('ps', "show instances"),
+    ('releases', "list releases"),
+    ('resolve', 'Resolve the host and port of a service'),
+    ('route', 'Set up a new REST route'),
+    ('run', 'Run a command'),
+    ('scale', 'Scale up a release'),
+    ('spawn', 'Spawn an instance of a service of a release'),
+    )
 
 
 def _import_command(mn):
@@ -32,6 +40,8 @@ def _import_command(mn):
     return m.Command
 
 
-def load():
-    """Load all commands."""
-    return ((mn, _import_command(mn)) for mn in _iter())
+def load_command(name):
+    """Import the module of command `name` and return its `Command`
+    class.
+    """
+    return _import_command(name)
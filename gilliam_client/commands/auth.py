@@ -18,8 +18,6 @@ import os
 import sys
 import time
 
-import requests
-
 from ..docker import DockerAuth, registry_from_repository
 
 
@@ -38,7 +36,6 @@ class Command(object):
         parser.add_argument("-r", "--registry", metavar="REGISTRY")
         parser.add_argument("-u", "--username", metavar="USERNAME")
         parser.add_argument("-p", "--password", metavar="PASSWORD")
-        self.docker_auth = DockerAuth(requests)
 
     def _credentials(self, options):
         if not options.username:
@@ -60,7 +57,8 @@ class Command(object):
         print "Please enter credentials for %s:\n" % (registry,)
         username, password = self._credentials(options)
 
-        if not self.docker_auth.check(registry, username, password):
+        if not DockerAuth(config.httpclient).check(registry, username,
+                                                   password):
             sys.exit("invalid username or password")
 
         with config.auth_config as ac:
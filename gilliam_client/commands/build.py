@@ -17,17 +17,49 @@ import sys
 import yaml
 
 from ..manifest import ProjectManifest
-from .. import build
+from .. import build, buildlog, context, trace
 
 
 class Command(object):
-    """Deploy a new release."""
+    """Build a new release."""
 
-    synopsis = 'Deploy a new release of the formation'
+    synopsis = 'Build a new release of the formation'
 
     def __init__(self, parser):
         parser.add_argument('--author', default=None)
         parser.add_argument('-m', '--message')
+        parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                            default=1, metavar='N',
+                            help='build N services at the same time')
+        parser.add_argument('--push-jobs', dest='push_jobs', type=int,
+                            metavar='N',
+                            help='push N images at the same time '
+                            '(defaults to --jobs)')
+        parser.add_argument('--check-registry', dest='check_registry',
+                            action='store_true',
+                            help='do not build services whose image '
+                            'already is in the registry')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='build services even if they are '
+                            'up to date')
+        parser.add_argument('--context-compression', dest='compression',
+                            choices=context.COMPRESSION_CODECS,
+                            help='compress the build context, if the '
+                            'builder supports it')
+        parser.add_argument('--context-compression-level', type=int,
+                            dest='compression_level', metavar='LEVEL')
+        parser.add_argument('--delta-context', dest='delta',
+                            action='store_true',
+                            help='only send files that changed since '
+                            'the last build, if the builder supports it')
+        parser.add_argument('--build-log', dest='build_log_dir',
+                            metavar='DIR',
+                            help='also write build output to a file '
+                            'per service in DIR')
+        parser.add_argument('--build-log-format',
+                            choices=buildlog.LOG_FORMATS,
+                            help='format of build log files')
+        trace.add_trace_argument(parser)
 
     def handle(self, config, options):
         """Handle the command."""
@@ -36,12 +68,21 @@ class Command(object):
         if not config.formation:
             sys.exit("no formation; specify using -f")
 
+        build_options = dict(compression=options.compression,
+                             compression_level=options.compression_level,
+                             delta=options.delta,
+                             build_log_dir=options.build_log_dir,
+                             build_log_format=options.build_log_format)
         manifest = ProjectManifest.load(config.project_dir)
         name = build.release(config, config.scheduler(),
                              build.create_services(manifest.services),
                              author=options.author,
                              message=options.message,
-                             quiet=options.quiet)
+                             jobs=options.jobs,
+                             push_jobs=options.push_jobs,
+                             check_registry=options.check_registry,
+                             rebuild=options.rebuild,
+                             build_options=build_options)
         if not options.quiet:
             print "released", name
         else:
@@ -17,7 +17,7 @@ import sys
 import yaml
 
 from ..manifest import ProjectManifest
-from .. import build, util
+from .. import build, buildlog, context, trace, util
 
 
 class Command(object):
@@ -30,22 +30,81 @@ class Command(object):
     def __init__(self, parser):
         parser.add_argument('--author', default=None)
         parser.add_argument('-m', '--message')
-        parser.add_argument('--rate', dest='rate')
+        parser.add_argument('--rate', dest='rate',
+                            help="least time between migration steps, "
+                            "in seconds or as steps per unit of time "
+                            "(such as 5/min)")
+        parser.add_argument('--max-surge', metavar='N',
+                            help="instances (or percent) to start above "
+                            "the desired number during a rolling migration")
+        parser.add_argument('--max-unavailable', metavar='N',
+                            help="instances (or percent) that may be "
+                            "unavailable during a rolling migration")
+        parser.add_argument('--batch-size', metavar='N', type=int,
+                            help="most instances to replace at a time")
+        parser.add_argument('--wait', action='store_true',
+                            help="wait until all instances run the release")
         parser.add_argument('--no-push', dest='push_images',
                             default=True, action='store_false')
+        parser.add_argument('-j', '--jobs', dest='jobs', type=int,
+                            default=1, metavar='N',
+                            help='build N services at the same time')
+        parser.add_argument('--push-jobs', dest='push_jobs', type=int,
+                            metavar='N',
+                            help='push N images at the same time '
+                            '(defaults to --jobs)')
+        parser.add_argument('--check-registry', dest='check_registry',
+                            action='store_true',
+                            help='do not build services whose image '
+                            'already is in the registry')
+        parser.add_argument('--rebuild', action='store_true',
+                            help='build services even if they are '
+                            'up to date')
+        parser.add_argument('--context-compression', dest='compression',
+                            choices=context.COMPRESSION_CODECS,
+                            help='compress the build context, if the '
+                            'builder supports it')
+        parser.add_argument('--context-compression-level', type=int,
+                            dest='compression_level', metavar='LEVEL')
+        parser.add_argument('--delta-context', dest='delta',
+                            action='store_true',
+                            help='only send files that changed since '
+                            'the last build, if the builder supports it')
+        parser.add_argument('--build-log', dest='build_log_dir',
+                            metavar='DIR',
+                            help='also write build output to a file '
+                            'per service in DIR')
+        parser.add_argument('--build-log-format',
+                            choices=buildlog.LOG_FORMATS,
+                            help='format of build log files')
+        trace.add_trace_argument(parser)
 
     def handle(self, config, options):
         """Handle the command."""
         if not config.formation:
             sys.exit("no formation; specify using -f")
 
-        rate = util.parse_rate(options.rate)
+        try:
+            rate = util.parse_rate(options.rate)
+        except ValueError:
+            sys.exit("%s: bad rate" % (options.rate,))
+        build_options = dict(compression=options.compression,
+                             compression_level=options.compression_level,
+                             delta=options.delta,
+                             build_log_dir=options.build_log_dir,
+                             build_log_format=options.build_log_format)
         defn = ProjectManifest.load(config.project_dir)
         scheduler = config.scheduler()
         name = build.release(
             config, scheduler, build.create_services(defn.services),
             author=options.author, message=options.message,
-            push_images=options.push_images)
+            push_images=options.push_images, jobs=options.jobs,
+            push_jobs=options.push_jobs,
+            check_registry=options.check_registry,
+            rebuild=options.rebuild, build_options=build_options)
         if not options.quiet:
             print "released %s" % (name,)
-        build.migrate(config, scheduler, name, rate)
+        build.migrate(config, scheduler, name, rate, wait=options.wait,
+                      max_surge=options.max_surge,
+                      max_unavailable=options.max_unavailable,
+                      batch_size=options.batch_size)
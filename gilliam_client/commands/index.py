@@ -0,0 +1,73 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+import time
+
+from ..index import FileIndex
+from ..manifest import ProjectManifest
+from ..services import custom
+
+
+class Command(object):
+    """\
+    Inspect the file index of the project.
+
+    The file index caches the digest of every file that is sent to
+    the builder, so that unchanged files do not have to be read again
+    when the tag of a service is computed.  Without options the tag of
+    every application root is computed and printed, updating the
+    index.
+
+    Use `--verify` to rehash every file and report entries with a
+    stale digest, and `--rebuild` to throw away the index and hash
+    everything from scratch.
+    """
+
+    synopsis = 'Verify or rebuild the file index'
+
+    def __init__(self, parser):
+        parser.add_argument('--verify', action='store_true')
+        parser.add_argument('--rebuild', action='store_true')
+
+    def _approots(self, config):
+        manifest = ProjectManifest.load(config.project_dir)
+        return sorted(set(
+                os.path.join(config.project_dir, defn.get('approot', '.'))
+                for defn in manifest.services.values()))
+
+    def handle(self, config, options):
+        """Handle the command."""
+        if not config.project_dir:
+            sys.exit("cannot find a gilliam.yml file")
+
+        stale = False
+        for approot in self._approots(config):
+            if options.verify:
+                for relpath in FileIndex.make(approot).verify():
+                    print "%s: stale" % (os.path.join(approot, relpath),)
+                    stale = True
+                continue
+
+            if options.rebuild:
+                with FileIndex.open(approot) as index:
+                    index.clear()
+
+            t0 = time.time()
+            tag = custom._compute_tag(approot)
+            print "%s %s (%.3fs)" % (tag, approot, time.time() - t0)
+
+        if stale:
+            sys.exit(1)
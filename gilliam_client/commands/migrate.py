@@ -16,22 +16,42 @@ import os
 import sys
 import time
 
-from .. import build, util
+from .. import build, trace, util
 
 
 class Command(object):
-    """Scale up a release."""
+    """Migrate to a release."""
 
-    synopsis = 'Build a release and migrate to it'
+    synopsis = 'Migrate the formation to a release'
 
     def __init__(self, parser):
         parser.add_argument('release')
-        parser.add_argument('--rate', dest='rate')
+        parser.add_argument('--rate', dest='rate',
+                            help="least time between migration steps, "
+                            "in seconds or as steps per unit of time "
+                            "(such as 5/min)")
+        parser.add_argument('--max-surge', metavar='N',
+                            help="instances (or percent) to start above "
+                            "the desired number during a rolling migration")
+        parser.add_argument('--max-unavailable', metavar='N',
+                            help="instances (or percent) that may be "
+                            "unavailable during a rolling migration")
+        parser.add_argument('--batch-size', metavar='N', type=int,
+                            help="most instances to replace at a time")
+        parser.add_argument('--wait', action='store_true',
+                            help="wait until all instances run the release")
+        trace.add_trace_argument(parser)
 
     def handle(self, config, options):
         """Handle the command."""
         if not config.formation:
             sys.exit("no formation; specify using -f")
 
-        rate = util.parse_rate(options.rate)
-        build.migrate(config, config.scheduler(), options.release, rate)
+        try:
+            rate = util.parse_rate(options.rate)
+        except ValueError:
+            sys.exit("%s: bad rate" % (options.rate,))
+        build.migrate(config, config.scheduler(), options.release, rate,
+                      wait=options.wait, max_surge=options.max_surge,
+                      max_unavailable=options.max_unavailable,
+                      batch_size=options.batch_size)
@@ -13,9 +13,11 @@
 # limitations under the License.
 
 import os
-import yaml
 import sys
 
+from .. import fmt
+
+
 _QUIET = [('name', 35, str)]
 _NORMAL = [('name', 35, str), ('release', 7, str), ('state', 9, str)]
 _VERBOSE = [('name', 35, str), ('release', 7, str), ('state', 9, str),
@@ -23,23 +25,6 @@ _VERBOSE = [('name', 35, str), ('release', 7, str), ('state', 9, str),
             ('command', 25, str)]
 
 
-def _fmt(spec, data):
-    """Format C{data} according to C{spec}."""
-    result = []
-    for i, (field, width, fmter) in enumerate(spec):
-        last = (len(spec) - 1) == i
-        value = fmter(data.get(field, ''))
-        result.append('%-*s' % (0 if last else width, value))
-    return ' '.join(result)
-
-
-def _header(spec):
-    result = []
-    for (field, width, fmter) in spec:
-        result.append('-' * width)
-    return ' '.join(result)
-
-
 class Command(object):
     """Display running instances."""
 
@@ -48,11 +33,7 @@ class Command(object):
     def __init__(self, parser):
         parser.add_argument('-v', '--verbose', dest="verbose",
                             action="store_true")
-
-    def _header(self, spec):
-        if os.isatty(sys.stdout.fileno()):
-            print _fmt(spec, {n: n for (n, w, f) in spec})
-            print _header(spec)
+        fmt.add_output_argument(parser)
 
     def handle(self, config, options):
         """Handle the command."""
@@ -66,9 +47,9 @@ class Command(object):
         else:
             spec = _NORMAL
 
-        if not options.quiet:
-            self._header(spec)
-
+        header = not options.quiet and os.isatty(sys.stdout.fileno())
         scheduler = config.scheduler()
-        for instance in scheduler.instances(config.formation):
-            print _fmt(spec, instance)
+        with fmt.Table(spec, sys.stdout, options.output,
+                       header=header) as table:
+            for instance in scheduler.instances(config.formation):
+                table.write(instance)
@@ -13,9 +13,14 @@
 # limitations under the License.
 
 import os
-import yaml
 import sys
 
+from .. import fmt
+
+
+_SPEC = [('name', 9, str), ('author', 15, lambda v: unicode(v or 'unknown')),
+         ('message', 40, unicode)]
+
 
 def last(it, default=None):
     for default in it:
@@ -30,17 +35,10 @@ class Command(object):
 
     def __init__(self, parser):
         parser.add_argument('--dump', metavar="NAME")
-
-    def _header(self):
-        if os.isatty(sys.stdout.fileno()):
-            print "%-9s %-15s %s" % ("name", "author", "message")
-            print "%-9s %-15s %s" % ("-" * 9, "-" * 15, "-" * 40)
-
-    def _print(self, release, options):
-        print "%-9s %-15s %s" % (release['name'], release.get(
-                'author', 'unknown'), release.get('message', ''))
+        fmt.add_output_argument(parser)
 
     def _dump(self, config, scheduler, name):
+        import yaml
         for release in scheduler.releases(config.formation):
             if release['name'] == name:
                 yaml.safe_dump(release, sys.stdout, encoding='utf-8', tags=None,
@@ -58,6 +56,7 @@ class Command(object):
         if options.dump:
             return self._dump(config, scheduler, options.dump)
 
-        self._header()
-        for release in scheduler.releases(config.formation):
-            self._print(release, options)
+        with fmt.Table(_SPEC, sys.stdout, options.output,
+                       header=os.isatty(sys.stdout.fileno())) as table:
+            for release in scheduler.releases(config.formation):
+                table.write(release)
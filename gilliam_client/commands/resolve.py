@@ -16,9 +16,9 @@ from gilliam.service_registry import Resolver
 
 
 class Command(object):
-    """Scale up a release."""
+    """Resolve a service."""
 
-    synopsis = 'Scale up a release'
+    synopsis = 'Resolve the host and port of a service'
 
     def __init__(self, parser):
         parser.add_argument('host')
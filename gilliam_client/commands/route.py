@@ -17,6 +17,8 @@ gilliam-cli route /builder/{tail:.*?} builder.service/{tail}
 gilliam-cli route api.router.com/builder/{tail:.}
 """
 
+import sys
+
 import shortuuid
 
 from .. import fmt
@@ -53,6 +55,7 @@ class Command(object):
         parser.add_argument("--auth-type", dest="auth_type")
         parser.add_argument('--authenticate-with', '--auth-with',
                             dest="auth_target")
+        fmt.add_output_argument(parser)
 
     def _parse_route(self, route):
         if ':' in route:
@@ -79,10 +82,9 @@ class Command(object):
         print "route %s created" % (route['name'],)
 
     def _list(self, router, config, options):
-        print fmt.fmt(_SPEC, {n: n for (n, w, t) in _SPEC})
-        print fmt.header(_SPEC)
-        for route in router.routes():
-            print fmt.fmt(_SPEC, route)
+        with fmt.Table(_SPEC, sys.stdout, options.output) as table:
+            for route in router.routes():
+                table.write(route)
 
     def handle(self, config, options):
         # Always assume that we're dealing with HTTP.
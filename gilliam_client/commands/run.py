@@ -14,17 +14,23 @@
 
 from functools import partial
 import contextlib
+import errno
 import fcntl
 import random
+import select
 import signal
 import sys
 import struct
 import os
 import termios
+import threading
+import time
 import yaml
 
 from gilliam.util import thread
 
+from .. import placement
+
 
 @contextlib.contextmanager
 def console():
@@ -56,6 +62,121 @@ def terminal_size(fd):
     return w, h
 
 
+def read_available(fd, size=65536):
+    """Yield input from `fd` as soon as it is available.
+
+    Every chunk holds all bytes that could be read at the time, so a
+    single keystroke is passed on at once while pasted text comes in
+    as one chunk rather than one per byte.
+    """
+    while True:
+        try:
+            select.select([fd], [], [])
+            data = os.read(fd, size)
+        except (select.error, OSError) as err:
+            # SIGWINCH interrupts the wait when the terminal is
+            # resized.
+            if err.args[0] == errno.EINTR:
+                continue
+            raise
+        if not data:
+            break
+        yield data
+
+
+class OutputSink(object):
+    """File-like object that collects output of a process and writes
+    it to `fd` from a thread of its own.
+
+    Output is written once `size` bytes have been collected, or when
+    no more output came in for `idle` seconds, so a process that
+    writes a lot gets large writes while an interactive session still
+    sees its output at once.  Writers are held up when a few times
+    `size` bytes are waiting, so that a slow `fd` slows down the
+    reader rather than filling up memory.
+    """
+
+    # number of buffers of `size` bytes that writers may get ahead of
+    # the thread, so that they are not held up while it wakes up.
+    _BACKLOG = 4
+
+    def __init__(self, fd, size=65536, idle=0.005):
+        self.fd = fd
+        self.size = size
+        self.idle = idle
+        self._chunks = []
+        self._buffered = 0
+        self._closed = False
+        self._cond = threading.Condition(threading.Lock())
+        self._thread = thread(self._run)
+
+    def write(self, data):
+        with self._cond:
+            while (self._buffered >= self._BACKLOG * self.size
+                   and not self._closed):
+                self._cond.wait()
+            if self._closed:
+                return
+            self._chunks.append(data)
+            self._buffered += len(data)
+            # the thread only has to be woken up for the first chunk
+            # and for a full buffer; while it waits for more output it
+            # looks for new chunks when the idle time is up.
+            if len(self._chunks) == 1 or self._buffered >= self.size:
+                self._cond.notify_all()
+
+    def flush(self):
+        pass
+
+    def _take(self):
+        """Wait for output to write.  Return an empty string when
+        closed and all output has been written.
+        """
+        with self._cond:
+            while not self._chunks and not self._closed:
+                self._cond.wait()
+            while self._buffered < self.size and not self._closed:
+                count = len(self._chunks)
+                self._cond.wait(self.idle)
+                if len(self._chunks) == count:
+                    break
+            data = ''.join(self._chunks)
+            self._chunks = []
+            self._buffered = 0
+            self._cond.notify_all()
+            return data
+
+    def _write(self, data):
+        view = memoryview(data)
+        while view:
+            try:
+                view = view[os.write(self.fd, view):]
+            except OSError as err:
+                if err.errno != errno.EINTR:
+                    raise
+
+    def _run(self):
+        try:
+            while True:
+                data = self._take()
+                if not data:
+                    break
+                self._write(data)
+        except EnvironmentError:
+            # the reader went away; drop the rest of the output.
+            with self._cond:
+                self._closed = True
+                self._chunks = []
+                self._cond.notify_all()
+
+    def close(self):
+        """Write out what is left and stop the thread."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        self._thread.join()
+
+
 class Command(object):
     """\
     Run a command on an executor:
@@ -76,6 +197,11 @@ class Command(object):
     Give `--tty` to force a TTY to be opened for the command (will
     normally only be done if a TTY is connected to the current
     terminal).
+
+    Give `--prefer-local-image` to run the command on an executor
+    that already has the image, if there is one, so that the command
+    does not have to wait for the image to be pulled.  How long the
+    command took to start is written to stderr.
     """
 
     synopsis = 'Run a command'
@@ -89,6 +215,8 @@ class Command(object):
         parser.add_argument('-e', '--env', metavar="VAR", action='append')
         parser.add_argument('-t', '--tty', dest='tty', action='store_true',
                             help="force tty input even if ")
+        parser.add_argument('--prefer-local-image', action='store_true',
+                            help="prefer executors that have the image")
         parser.add_argument('image')
         parser.add_argument('command', nargs='*')
 
@@ -136,25 +264,24 @@ class Command(object):
         w, h = terminal_size(sys.stdin.fileno())
         process.resize_tty(w, h)
 
-    def _select_executor(self, config, options):
-        alts = config.service_registry.query_formation('executor')
+    def _select_executor(self, config, options, holders=()):
+        alts = [d for (k, d)
+                in config.service_registry.query_formation('executor')]
         if options.executor:
             for alt in alts:
                 if alt['instance'] == options.executor:
                     return alt
             sys.exit("cannot find executor instance %s" % (options.executor,))
+        elif options.prefer_local_image:
+            return placement.prefer_image(alts, options.image, holders)
         else:
-            return random.choice([d for (k, d) in alts])
+            return random.choice(alts)
 
     def handle(self, config, options):
-        instance = self._select_executor(config, options)
-        executor = config.executor('%s.api.executor.service' % (
-                instance['instance'],))
         env = {}
 
         tty = istty() or options.tty
-        reader = (iter(partial(sys.stdin.read, 1), '') if tty else
-                  iter(partial(sys.stdin.read, 4096), ''))
+        reader = read_available(sys.stdin.fileno())
 
         if options.service:
             self._service(config, options, env)
@@ -162,22 +289,44 @@ class Command(object):
         if options.env:
             env.update(self._make_env(options))
 
+        holders = ()
+        if options.prefer_local_image and config.formation:
+            holders = placement.image_holders(
+                config.scheduler().instances(config.formation),
+                options.image)
+        instance = self._select_executor(config, options, holders)
+        executor = config.executor('%s.api.executor.service' % (
+                instance['instance'],))
+
         command = None if not options.command else options.command
 
+        t0 = time.time()
         process = executor.run(config.formation, options.image,
                                env, command, tty=tty)
         process.wait_for_state('running', 'done', 'error')
+        if options.prefer_local_image:
+            sys.stderr.write("started on %s in %.1f s (%s)\n" % (
+                    instance['instance'], time.time() - t0,
+                    "image was cached, no pull needed"
+                    if placement.has_image(instance, options.image, holders)
+                    else "no executor had the image"))
 
         if istty():
             with console():
+                output = OutputSink(sys.stdout.fileno())
                 old_handler = signal.signal(signal.SIGWINCH, partial(
                         self._winch, process))
-                thread(process.attach, reader, sys.stdout, replay=True)
+                thread(process.attach, reader, output, replay=True)
                 thread(self._winch, process)
                 exit_code = process.wait()
+                output.close()
             signal.signal(signal.SIGWINCH, old_handler)
         else:
-            thread(process.attach, reader, sys.stdout)
+            sys.stdout.flush()
+            output = OutputSink(sys.stdout.fileno(), size=1 << 20,
+                                idle=0.05)
+            thread(process.attach, reader, output)
             exit_code = process.wait()
+            output.close()
 
         sys.exit(exit_code)
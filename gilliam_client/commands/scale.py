@@ -12,9 +12,17 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import itertools
 import os
 import sys
-import time
+
+from .. import trace, util
+from ..watch import InstanceWatch, changed, scaled
+
+
+# longest time to wait for the formation to change and settle between
+# calls to `scale`.
+_SCALE_TIMEOUT = 60
 
 
 class Command(object):
@@ -25,16 +33,13 @@ class Command(object):
     def __init__(self, parser):
         parser.add_argument('release')
         parser.add_argument("scale", nargs='+')
-        parser.add_argument('--rate', dest='rate')
-
-    def _parse_rate(self, rate):
-        """Parse rate and return number of seconds to pause between
-        calls to C{scale}.
-        """
-        if not rate:
-            return 0
-        else:
-            return 10
+        parser.add_argument('--rate', dest='rate',
+                            help="least time between calls to the "
+                            "scheduler, in seconds or as calls per "
+                            "unit of time (such as 5/min)")
+        parser.add_argument('--wait', action='store_true',
+                            help="wait until the instances are running")
+        trace.add_trace_argument(parser)
 
     def _parse_scale(self, scale):
         try:
@@ -43,20 +48,36 @@ class Command(object):
         except (TypeError, ValueError):
             sys.exit("%s: bad scale format" % (scale,))
 
-    def _scale(self, config, release, scales, rate):
+    def _scale(self, config, release, scales, rate, wait):
         scheduler = config.scheduler()
-        while True:
-            more = scheduler.scale(config.formation, release,
-                                   scales)
-            if not more:
-                break
-            else:
-                time.sleep(rate)
+        watch = InstanceWatch(scheduler, config.formation)
+        throttle = util.Throttle(rate)
+        try:
+            for step in itertools.count():
+                throttle.wait()
+                before = watch.snapshot()
+                with trace.span('scale step', release=release,
+                                step=step) as args:
+                    more = args['more'] = scheduler.scale(
+                        config.formation, release, scales)
+                    if not more:
+                        break
+                    # wait for the call to take effect before calling
+                    # again.
+                    watch.wait(changed(before), _SCALE_TIMEOUT,
+                               refresh=True)
+            if wait:
+                watch.wait(scaled(release, scales))
+        finally:
+            watch.close()
 
     def handle(self, config, options):
         """Handle the command."""
         if not config.formation:
             sys.exit("no formation; specify using -f")
         scales = dict(self._parse_scale(scale) for scale in options.scale)
-        rate = self._parse_rate(options.rate)
-        self._scale(config, options.release, scales, rate)
+        try:
+            rate = util.parse_rate(options.rate)
+        except ValueError:
+            sys.exit("%s: bad rate" % (options.rate,))
+        self._scale(config, options.release, scales, rate, options.wait)
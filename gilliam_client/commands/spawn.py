@@ -20,9 +20,9 @@ from .. import errors, util, port_spec
 
 
 class Command(object):
-    """Launch a new formation from a release manifest."""
+    """Spawn an instance of a service."""
 
-    synopsis = 'Launch a formation from a release manifest'
+    synopsis = 'Spawn an instance of a service of a release'
 
     def __init__(self, parser):
         parser.add_argument('service', help='service template')
@@ -35,18 +35,13 @@ from functools import partial
 import os.path
 import os
 import string
-import yaml
 import sys
+import threading
 import time
 import errno
 
-from gilliam.service_registry import ServiceRegistryClient
-from gilliam.service_registry import Resolver
-from gilliam.adapter import ResolveAdapter, WebSocketAdapter
-from gilliam import (BuilderClient, ExecutorClient,
-                     SchedulerClient, RouterClient)
-from requests.adapters import HTTPAdapter
-import requests
+from . import startup
+from .cache import MAX_CACHE_SIZE, ReleaseCache
 
 
 class FormationConfig(object):
@@ -103,6 +98,22 @@ for name in ['stage', 'formation']:
 _RAISE_ERROR = object()
 
 
+def _boolean(value):
+    return value.lower() in ('1', 'yes', 'true', 'on')
+
+
+def _int_mapping(value):
+    """Parse a `key=value,...` string with integer values."""
+    if isinstance(value, dict):
+        return value
+    mapping = {}
+    for item in value.split(','):
+        if item.strip():
+            key, val = item.split('=', 1)
+            mapping[key.strip()] = int(val)
+    return mapping
+
+
 class StageConfig(object):
     """Stage configuration holds information and data about
     installation of Gilliam, such as address to the service registry.
@@ -117,6 +128,19 @@ class StageConfig(object):
     __vars__ = (
         ('repository', getpass.getuser(), str),
         ('service_registry', None, partial(string.split, sep=',')),
+        ('context_compression', None, str),
+        ('context_compression_level', None, int),
+        ('context_delta', None, _boolean),
+        ('prefetch', 1, int),
+        ('cache_size', MAX_CACHE_SIZE, int),
+        ('registry_ttl', 30, int),
+        ('pool_sizes', None, _int_mapping),
+        ('auth_check_ttl', 600, int),
+        ('executor_placement', 'affinity', str),
+        ('build_log_dir', None, os.path.expanduser),
+        ('build_log_format', 'plain', str),
+        ('build_log_level', 'info', str),
+        ('build_log_tail', 50, int),
         )
 
     def __init__(self, path):
@@ -161,6 +185,7 @@ class StageConfig(object):
         :raises: IOError, OSError
         """
         with open(self._path) as fp:
+            import yaml
             self._config.update(yaml.load(fp))
 
     def write(self, path=None):
@@ -177,6 +202,7 @@ class StageConfig(object):
         path = path if path else self._path
         if path is None:
             raise ValueError("path not specified")
+        import yaml
         with open(self._path, 'w') as fp:
             yaml.safe_dump(self._config, fp, encoding='utf-8', tags=None,
                            default_flow_style=False)
@@ -322,9 +348,20 @@ class AuthConfig(object):
 
     def __init__(self, path, credentials=None):
         self.path = path
-        if credentials is None:
-            credentials = {}
-        self.credentials = credentials
+        self._credentials = credentials
+
+    @property
+    def credentials(self):
+        """The cached credentials.  Read from the file the first time
+        they are needed, unless given when the object was created.
+        """
+        if self._credentials is None:
+            self._read()
+        return self._credentials
+
+    @credentials.setter
+    def credentials(self, credentials):
+        self._credentials = credentials
 
     def get(self, registry):
         """Get credentials for `registry` or `None` if the config do
@@ -349,6 +386,7 @@ class AuthConfig(object):
         """
         try:
             with open(self.path, 'r') as fp:
+                import yaml
                 data = yaml.load(fp)
         except EnvironmentError as err:
             if err.errno != errno.ENOENT:
@@ -371,6 +409,7 @@ class AuthConfig(object):
                            'password': cred.password}
                 for registry, cred in self.credentials.items()}
 
+        import yaml
         with open(self.path, 'w') as fp:
             yaml.safe_dump(data, fp, default_flow_style=False)
         os.chmod(self.path, 0600)
@@ -383,16 +422,34 @@ class AuthConfig(object):
 
     @classmethod
     def make(cls, path):
-        """Read credentials from `path` and store them in a newly
-        created `AuthConfig` object that is returned.  If the file
-        does not exist, a empty object is returned.
+        """Create an `AuthConfig` object for the credentials stored at
+        `path`.  The file is read when the credentials are first
+        needed; if it does not exist, the object is empty.
 
         :params path: Path to where existing credentials are stored.
         :returns: Newly created `AuthConfig` object.
         """
-        ac = cls(path)
-        ac._read()
-        return ac
+        return cls(path)
+
+
+class _lazy(object):
+    """Decorator for a property that is computed when it is first
+    accessed, and then cached in the instance.
+    """
+    _lock = threading.RLock()
+
+    def __init__(self, fn):
+        self.fn = fn
+        self.__name__ = fn.__name__
+        self.__doc__ = fn.__doc__
+
+    def __get__(self, obj, cls=None):
+        if obj is None:
+            return self
+        with self._lock:
+            if self.__name__ not in obj.__dict__:
+                obj.__dict__[self.__name__] = self.fn(obj)
+        return obj.__dict__[self.__name__]
 
 
 class Config(object):
@@ -411,30 +468,121 @@ class Config(object):
     """
 
     def __init__(self, project_dir, stage_config, form_config, auth_config,
-                 stage, formation):
+                 stage, formation, cache_dir=None):
         self.project_dir = project_dir
         self.stage_config = stage_config
         self.form_config = form_config
         self.auth_config = auth_config
         self.stage = stage
         self.formation = formation
+        self.cache_dir = cache_dir
+
+    @_lazy
+    def registry_client(self):
+        """Client that always asks the service registry, bypassing
+        the snapshot."""
+        from gilliam.service_registry import ServiceRegistryClient
+        client = ServiceRegistryClient(time, self.stage_config.service_registry)
+        # the client opens a session per cluster node; send them all
+        # through the pool of the `service-registry` target.
+        adapter = self.pools.adapter('service-registry')
+        for (node, session) in client.cluster_nodes:
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        return client
+
+    @_lazy
+    def service_registry(self):
+        client = self.registry_client
+        if not self.cache_dir or not self.stage_config.registry_ttl:
+            return client
+        from .registry import RegistrySnapshot, SnapshotRegistryClient
+        return SnapshotRegistryClient(client, RegistrySnapshot.make(
+                self.cache_dir, self.stage, self.stage_config.registry_ttl,
+                time))
+
+    @_lazy
+    def _resolver(self):
+        from gilliam.service_registry import Resolver
+        return Resolver(self.service_registry)
+
+    @_lazy
+    def httpclient(self):
+        with startup.timed('create http client'):
+            from gilliam.adapter import ResolveAdapter, WebSocketAdapter
+            import requests
+            from .pool import TargetAdapter
+            from .registry import SnapshotRegistryClient, SnapshotResolveAdapter
+            if isinstance(self.service_registry, SnapshotRegistryClient):
+                adapter = partial(SnapshotResolveAdapter,
+                                  resolver=self._resolver,
+                                  registry=self.service_registry)
+            else:
+                adapter = partial(ResolveAdapter, resolver=self._resolver)
+            httpclient = requests.Session()
+            httpclient.mount('http://', TargetAdapter(self.pools, adapter))
+            httpclient.mount('https://', self.pools.adapter('registry'))
+            httpclient.mount('ws://', adapter(WebSocketAdapter()))
+            return httpclient
+
+    @_lazy
+    def registry_auth(self):
+        from .docker import DockerAuth, RegistryAuth
+        return RegistryAuth(
+            DockerAuth(self.httpclient), self.auth_config,
+            os.path.join(os.path.dirname(self.auth_config.path),
+                         'auth-checked'),
+            self.stage_config.auth_check_ttl)
+
+    @_lazy
+    def pools(self):
+        from .pool import Pools
+        return Pools(_int_mapping(self.stage_config.pool_sizes or {}))
+
+    @_lazy
+    def placement(self):
+        """Strategy for picking the executor to build a service on."""
+        from . import placement
+        affinity = placement.ExecutorAffinity.make(self.cache_dir, self.stage)
+        try:
+            return placement.make(self.stage_config.executor_placement,
+                                  self.formation, affinity)
+        except ValueError as err:
+            sys.exit(str(err))
+
+    def close(self):
+        """Close the connection pools, if any were created."""
+        if 'pools' in self.__dict__:
+            self.pools.close()
+
+    @_lazy
+    def release_cache(self):
+        if not self.cache_dir:
+            return None
+        return partial(ReleaseCache.make, self.cache_dir, self.stage,
+                       max_size=self.stage_config.cache_size)
+
+    def scheduler(self, *args, **kwargs):
+        from .scheduler import SchedulerClient
+        kwargs.setdefault('prefetch', self.stage_config.prefetch)
+        kwargs.setdefault('cache', self.release_cache)
+        return SchedulerClient(self.httpclient, *args, **kwargs)
+
+    def executor(self, *args, **kwargs):
+        from gilliam import ExecutorClient
+        return ExecutorClient(self.httpclient, *args, **kwargs)
 
-        self.httpclient = requests.Session()
-        self.service_registry = ServiceRegistryClient(time, stage_config.service_registry)
-        self._resolver = Resolver(self.service_registry)
-        self.httpclient.mount('http://', ResolveAdapter(HTTPAdapter(),
-                                                        self._resolver))
-        self.httpclient.mount('ws://', ResolveAdapter(WebSocketAdapter(),
-                                                      self._resolver))
+    def builder(self, *args, **kwargs):
+        from gilliam import BuilderClient
+        return BuilderClient(self.httpclient, *args, **kwargs)
 
-        self.scheduler = partial(SchedulerClient, self.httpclient)
-        self.executor = partial(ExecutorClient, self.httpclient)
-        self.builder = partial(BuilderClient, self.httpclient)
-        self.router = partial(RouterClient, self.httpclient)
+    def router(self, *args, **kwargs):
+        from gilliam import RouterClient
+        return RouterClient(self.httpclient, *args, **kwargs)
 
     @classmethod
     def make(cls, project_dir, stage_config, form_config, auth_config,
-             stage, formation):
+             stage, formation, cache_dir=None):
         return cls(
-            project_dir, stage_config, form_config, auth_config, stage, formation
-            )
+            project_dir, stage_config, form_config, auth_config, stage, formation,
+            cache_dir)
@@ -0,0 +1,399 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The build context is the set of files in an application root that
+is sent to the builder.
+
+The application root is walked once, and the same list of files is
+used both to compute the tag of the context and to produce the
+tarball that is streamed to the builder.  While the tarball is
+produced the content of every file is hashed again, so that it can be
+verified that the uploaded data is exactly what the tag was computed
+from.
+"""
+
+import bz2
+import errno
+import hashlib
+import json
+import os
+import stat
+import tarfile
+import time
+import zlib
+
+from .ignore import IgnoreMatcher, parse_lines
+from .index import FileIndex
+
+
+_EXCLUDE_DIRS = ['CVS', 'RCS', 'SCCS', '.git',
+                 '.svn', '.arch-ids', '{arch}',
+                 '.bzr', '.hg', '_darcs', '.gilliam']
+_EXCLUDE_FILES = ['.gitignore', '.cvsignore',
+                  '.hgignore', '.bzrignore',
+                  'gilliam.yml', '.#*', '*~', '#*#']
+
+_NUL = '\0'
+
+COMPRESSION_CODECS = ('none', 'gzip', 'bz2', 'xz')
+
+
+def read_ignore_patterns(dir, filename='.gilliam/ignore'):
+    """Read content of the **ignore** file.  The file contains
+    patterns, that if they match a file or directory, means that the
+    subject should not be included in the data that will be sent to
+    the build server.  See `gilliam_client.ignore` for the syntax.
+    """
+    path = os.path.join(dir, filename)
+    if not os.path.exists(path):
+        return []
+
+    with open(path) as fp:
+        return parse_lines(fp)
+
+
+def _tarinfo(relpath, st, linkname=None):
+    """Construct a tar header for the entry at `relpath`."""
+    info = tarfile.TarInfo('./' + relpath)
+    info.mode = stat.S_IMODE(st.st_mode)
+    info.mtime = int(st.st_mtime)
+    info.uid = st.st_uid
+    info.gid = st.st_gid
+    if stat.S_ISDIR(st.st_mode):
+        info.type = tarfile.DIRTYPE
+    elif stat.S_ISLNK(st.st_mode):
+        info.type = tarfile.SYMTYPE
+        info.linkname = linkname
+    else:
+        info.type = tarfile.REGTYPE
+        info.size = st.st_size
+    return info.tobuf(tarfile.GNU_FORMAT)
+
+
+def _generated_tarinfo(relpath, size):
+    """Construct a tar header for a generated file."""
+    info = tarfile.TarInfo('./' + relpath)
+    info.mode = 0644
+    info.mtime = int(time.time())
+    info.size = size
+    return info.tobuf(tarfile.GNU_FORMAT)
+
+
+def _padding(size, blocksize=tarfile.BLOCKSIZE):
+    remainder = size % blocksize
+    return _NUL * (blocksize - remainder) if remainder else ''
+
+
+class BuildContext(object):
+    """The files of an application root that make up a build.
+
+    Construct it using `make`, which walks the directory::
+
+       >>> context = BuildContext.make(approot)
+       >>> context.tag()
+       '...'
+       >>> for data in context.stream(1024 * 1024):
+       ...     upload(data)
+       >>> context.changed
+       []
+
+    If `changed` is non-empty after the stream has been consumed,
+    some files were modified between the tag was computed and they
+    were uploaded.
+    """
+
+    def __init__(self, rootdir, matcher):
+        self.rootdir = rootdir
+        self.matcher = matcher
+        self.entries = []
+        self.digests = {}
+        self.changed = []
+
+    def _walk(self):
+        """Walk the directory and collect every entry that should be
+        part of the context, in a stable order.
+        """
+        entries = []
+        for (dirpath, dirnames, filenames) in os.walk(self.rootdir):
+            reldir = os.path.relpath(dirpath, self.rootdir)
+            reldir = '' if reldir == '.' else reldir
+            dirnames[:] = sorted(self.matcher.filter(reldir, dirnames, True))
+            names = sorted(self.matcher.filter(reldir, filenames) + dirnames)
+            for name in names:
+                path = os.path.join(dirpath, name)
+                st = os.lstat(path)
+                if not (stat.S_ISREG(st.st_mode) or stat.S_ISDIR(st.st_mode)
+                        or stat.S_ISLNK(st.st_mode)):
+                    continue
+                entries.append((os.path.relpath(path, self.rootdir), st))
+        self.entries = entries
+
+    def _link_digest(self, relpath):
+        target = os.readlink(os.path.join(self.rootdir, relpath))
+        return hashlib.md5('-> ' + target).hexdigest(), target
+
+    def tag(self):
+        """Compute the tag of the context.
+
+        The tag is derived from the path and digest of every entry.
+        Digests of regular files are taken from the file index, so
+        only files that changed since the last build are read.
+        """
+        h = hashlib.md5()
+        with FileIndex.open(self.rootdir) as index:
+            for relpath, st in self.entries:
+                if stat.S_ISDIR(st.st_mode):
+                    digest = ''
+                elif stat.S_ISLNK(st.st_mode):
+                    digest = self._link_digest(relpath)[0]
+                else:
+                    digest = index.digest(relpath, st)
+                self.digests[relpath] = digest
+                h.update('%s\0%s\n' % (relpath, digest))
+        return h.hexdigest()
+
+    def _stream_file(self, relpath, st, chunk_size):
+        """Yield the content of the file at `relpath`, exactly
+        `st.st_size` bytes long, and record if it differs from what
+        the tag was computed from.
+        """
+        h = hashlib.md5()
+        remaining = st.st_size
+        with open(os.path.join(self.rootdir, relpath), 'rb') as fp:
+            while remaining:
+                data = fp.read(min(chunk_size, remaining))
+                if not data:
+                    break
+                remaining -= len(data)
+                h.update(data)
+                yield data
+            grown = not remaining and fp.read(1) != ''
+        if remaining:
+            yield _NUL * remaining
+        if (remaining or grown
+                or h.hexdigest() != self.digests.get(relpath)):
+            self.changed.append(relpath)
+
+    def delta(self, manifest):
+        """Compare the context with the `manifest` of an earlier
+        upload.  Must be called after `tag`.
+
+        :returns: A tuple of the set of paths that were added or
+            changed, and a sorted list of paths that were removed.
+        """
+        changed = set(relpath for (relpath, digest) in self.digests.items()
+                      if digest and manifest.files.get(relpath) != digest)
+        deleted = sorted(set(manifest.files) - set(self.digests))
+        return changed, deleted
+
+    def stream(self, chunk_size, only=None, extra=()):
+        """Produce an uncompressed tarball of the context, yielding
+        it in chunks of about `chunk_size` bytes.
+
+        :param only: (Optional) If given, only files and symbolic links
+            with a path in `only` are included.  Directories are always
+            included.
+
+        :param extra: (Optional) Sequence of `(relpath, data)` tuples
+            of generated files to append to the tarball.
+        """
+        pending, size, written = [], 0, 0
+        for relpath, st in self.entries:
+            if (only is not None and not stat.S_ISDIR(st.st_mode)
+                    and relpath not in only):
+                continue
+            if stat.S_ISLNK(st.st_mode):
+                digest, target = self._link_digest(relpath)
+                if digest != self.digests.get(relpath):
+                    self.changed.append(relpath)
+                header = _tarinfo(relpath, st, target)
+            else:
+                header = _tarinfo(relpath, st)
+            pending.append(header)
+            size += len(header)
+
+            if stat.S_ISREG(st.st_mode):
+                for data in self._stream_file(relpath, st, chunk_size):
+                    pending.append(data)
+                    size += len(data)
+                    if size >= chunk_size:
+                        data = ''.join(pending)
+                        written += len(data)
+                        yield data
+                        pending, size = [], 0
+                pending.append(_padding(st.st_size))
+                size += len(pending[-1])
+
+            if size >= chunk_size:
+                data = ''.join(pending)
+                written += len(data)
+                yield data
+                pending, size = [], 0
+
+        for relpath, data in extra:
+            for part in (_generated_tarinfo(relpath, len(data)), data,
+                         _padding(len(data))):
+                pending.append(part)
+                size += len(part)
+
+        # end-of-archive marker, padded to a full record.
+        pending.append(_NUL * (tarfile.BLOCKSIZE * 2))
+        size += tarfile.BLOCKSIZE * 2
+        pending.append(_padding(written + size, tarfile.RECORDSIZE))
+        yield ''.join(pending)
+
+    @classmethod
+    def make(cls, rootdir):
+        """Collect the build context of `rootdir`, honoring the
+        patterns in its `.gilliam/ignore` file.
+        """
+        matcher = IgnoreMatcher(_EXCLUDE_DIRS + _EXCLUDE_FILES
+                                + read_ignore_patterns(rootdir))
+        context = cls(rootdir, matcher)
+        context._walk()
+        return context
+
+
+class UploadManifest(object):
+    """The tag and file digests of the last successful upload of the
+    build context of a service.  Lives in `.gilliam/uploads/<service>`
+    in the application root.
+
+    It is used to send only the files that changed since the last
+    upload, on top of the image that upload resulted in.
+    """
+
+    def __init__(self, path, tag=None, files=None):
+        self.path = path
+        self.tag = tag
+        self.files = files if files is not None else {}
+
+    def _read(self):
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return
+        except ValueError:
+            return
+        self.tag = data.get('tag')
+        self.files = data.get('files', {})
+
+    def write(self, tag, digests):
+        """Record a successful upload of a context with the given
+        `tag` and `digests`.
+        """
+        self.tag = tag
+        self.files = {relpath: digest for (relpath, digest)
+                      in digests.items() if digest}
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as fp:
+            json.dump({'tag': self.tag, 'files': self.files}, fp,
+                      separators=(',', ':'))
+        os.rename(tmp, self.path)
+
+    @classmethod
+    def make(cls, rootdir, name):
+        """Read the manifest of service `name` in `rootdir`."""
+        manifest = cls(os.path.join(rootdir, '.gilliam', 'uploads', name))
+        manifest._read()
+        return manifest
+
+
+def _lzma():
+    try:
+        import lzma
+    except ImportError:
+        try:
+            from backports import lzma
+        except ImportError:
+            raise ValueError("xz compression requires backports.lzma")
+    return lzma
+
+
+# lowest, highest and default compression level of each codec.
+_LEVELS = {'gzip': (0, 9, 6), 'bz2': (1, 9, 9), 'xz': (0, 9, 6)}
+
+
+def _compressor(codec, level):
+    """Return a compressor object for `codec`, or `None` if the
+    context should be sent uncompressed.
+
+    :raises: ValueError if the codec is unknown or not available, or
+        the level is out of range.
+    """
+    if codec in (None, 'none'):
+        return None
+    if codec not in _LEVELS:
+        raise ValueError("unknown compression %r" % (codec,))
+    lowest, highest, default = _LEVELS[codec]
+    if level is None:
+        level = default
+    elif not lowest <= level <= highest:
+        raise ValueError("%s compression level must be between %d and %d" % (
+                codec, lowest, highest))
+    if codec == 'gzip':
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    elif codec == 'bz2':
+        return bz2.BZ2Compressor(level)
+    return _lzma().LZMACompressor(preset=level)
+
+
+class ContextStream(object):
+    """Iterable over the chunks of a build context tarball that
+    optionally compresses the data and keeps track of how much data
+    that has passed through it::
+
+       >>> stream = ContextStream(context.stream(1024 * 1024), 'gzip')
+       >>> upload(stream)
+       >>> stream.raw_bytes, stream.wire_bytes, stream.elapsed
+       (10485760, 1310720, 2.5)
+
+    """
+
+    def __init__(self, chunks, codec=None, level=None, clock=time):
+        self.chunks = chunks
+        self.codec = codec or 'none'
+        self.clock = clock
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+        self.elapsed = 0
+        self._compressor = _compressor(codec, level)
+
+    def _wire(self, data):
+        self.wire_bytes += len(data)
+        return data
+
+    def __iter__(self):
+        t0 = self.clock.time()
+        try:
+            for data in self.chunks:
+                self.raw_bytes += len(data)
+                if self._compressor is not None:
+                    data = self._compressor.compress(data)
+                if data:
+                    yield self._wire(data)
+            if self._compressor is not None:
+                data = self._compressor.flush()
+                if data:
+                    yield self._wire(data)
+        finally:
+            self.elapsed = self.clock.time() - t0
@@ -14,7 +14,12 @@
 
 """Functions that are specific to docker."""
 
+import errno
+import hashlib
 import json
+import os
+import threading
+import time
 
 
 _DEFAULT_REGISTRY = 'index.docker.io'
@@ -59,6 +64,15 @@ def _verify_registry(registry):
         raise ValueError("registry must contain either '.' or ':'")
     
 
+def _repository_path(repository):
+    """Return the path of `repository` within its registry."""
+    if is_registry(repository) and '/' in repository:
+        registry, repository = repository.split('/', 1)
+    if '/' not in repository:
+        repository = 'library/%s' % (repository,)
+    return repository
+
+
 def _registry_endpoint(registry):
     """Convert a registry into an endpoint."""
     try:
@@ -90,3 +104,134 @@ class DockerAuth(object):
             return False
 
         return {'username': username, 'password': password}
+
+    def has_image(self, repository, tag, auth=None):
+        """Check if the registry already holds an image for
+        `repository` tagged with `tag`.
+
+        :param auth: (Optional) Credentials as returned by `check`.
+        """
+        endpoint = _registry_endpoint(registry_from_repository(repository))
+        credentials = ((auth['username'], auth['password']) if auth else
+                       None)
+        response = self.requests.get('%s/repositories/%s/tags/%s' % (
+                endpoint, _repository_path(repository), tag),
+                                     auth=credentials)
+        return response.status_code == 200
+
+
+def _digest(username, password):
+    return hashlib.sha1('%s\0%s' % (username, password)).hexdigest()
+
+
+class RegistryAuth(object):
+    """Checks credentials for registries, remembering the outcome for
+    the rest of the process, and successful checks for `ttl` seconds
+    on disk at `path` (if given).  Only a digest of the credentials is
+    stored on disk.
+
+    Checks of a registry are serialized, so when several services are
+    built at the same time only the first one talks to the registry,
+    and if the credentials are bad all of them fail right away.
+    """
+
+    def __init__(self, docker_auth, auth_config, path=None, ttl=0,
+                 clock=time):
+        self.docker_auth = docker_auth
+        self.auth_config = auth_config
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self._results = {}
+        self._lock = threading.Lock()
+        self._locks = {}
+
+    def _read(self):
+        try:
+            with open(self.path) as fp:
+                return json.load(fp)
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            pass
+        return {}
+
+    def _write(self, checked):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as fp:
+            os.chmod(tmp, 0600)
+            json.dump(checked, fp)
+        os.rename(tmp, self.path)
+
+    def _cached(self, registry, digest):
+        """Return true if a check of `registry` with credentials that
+        have the given `digest` (or `None` for anonymous access) was
+        recorded on disk and has not expired.
+        """
+        if not self.path or not self.ttl:
+            return False
+        entry = self._read().get(registry)
+        return (entry is not None and entry.get('digest') == digest
+                and entry.get('expires', 0) > self.clock.time())
+
+    def _remember(self, registry, digest):
+        if not self.path or not self.ttl:
+            return
+        now = self.clock.time()
+        checked = {name: entry for (name, entry) in self._read().items()
+                   if entry.get('expires', 0) > now}
+        checked[registry] = {'digest': digest, 'expires': now + self.ttl}
+        self._write(checked)
+
+    def _check(self, registry):
+        cred = self.auth_config.get(registry)
+        digest = (_digest(cred.username, cred.password) if cred else
+                  None)
+        if self._cached(registry, digest):
+            return ({'username': cred.username, 'password': cred.password}
+                    if cred else None)
+
+        if self.docker_auth.anonymous(registry):
+            self._remember(registry, None)
+            return None
+
+        if not cred:
+            raise Exception("need to authenticate with %s" % (
+                    registry,))
+
+        authcfg = self.docker_auth.check(registry, cred.username,
+                                         cred.password)
+        if not authcfg:
+            raise Exception("need to authenticate with %s" % (
+                    registry,))
+        self._remember(registry, digest)
+        return authcfg
+
+    def check(self, registry):
+        """Check that the user may push to `registry`.
+
+        :raises: Exception if the user need to authenticate with the
+            registry.
+        :returns: Credentials to pass to the executor, or `None` if
+            the registry allows anonymous access.
+        """
+        with self._lock:
+            lock = self._locks.setdefault(registry, threading.Lock())
+        with lock:
+            result = self._results.get(registry)
+            if result is None:
+                try:
+                    result = (self._check(registry), None)
+                except Exception as err:
+                    result = (None, err)
+                self._results[registry] = result
+        authcfg, err = result
+        if err is not None:
+            raise err
+        return authcfg
@@ -19,6 +19,9 @@ class GilliamClientError(Exception):
 class ConflictError(GilliamClientError):
     pass
 
+class CancelledError(GilliamClientError):
+    pass
+
 
 def convert_error(response):
     if response.status_code == 409:
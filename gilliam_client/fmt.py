@@ -12,6 +12,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import json
+
 
 def fmt(spec, data):
     """Format C{data} according to C{spec}."""
@@ -28,3 +30,128 @@ def header(spec):
     for (field, width, fmter) in spec:
         result.append('-' * width)
     return ' '.join(result)
+
+
+OUTPUT_FORMATS = ('table', 'json', 'jsonl', 'yaml', 'tsv')
+
+# number of rows that column widths are computed from.
+_SAMPLE_SIZE = 100
+
+# columns never grow wider than this from the sample.
+_MAX_WIDTH = 60
+
+# number of bytes to buffer before writing.
+_BUFFER_SIZE = 64 * 1024
+
+
+def add_output_argument(parser):
+    """Add the `--output` option to the parser of a command."""
+    parser.add_argument('-o', '--output', choices=OUTPUT_FORMATS,
+                        default='table', help="output format")
+
+
+def _tsv_escape(value):
+    return (value.replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n'))
+
+
+class Table(object):
+    """Writes rows of a listing to `fp` as they are produced::
+
+       with Table(spec, sys.stdout, options.output) as table:
+           for instance in scheduler.instances(formation):
+               table.write(instance)
+
+    For the `table` format the columns of C{spec} are sized to fit
+    the first rows; the width in the spec is the least width.  The
+    `json`, `jsonl` and `yaml` formats hold complete items and `tsv`
+    the columns of the spec.  Output is encoded one row at a time, so
+    a listing never has to be held in memory.
+
+    :param header: (Optional) If false, no header is written for the
+        `table` format.  The `tsv` format always starts with the names
+        of the columns.
+    """
+
+    def __init__(self, spec, fp, output='table', header=True,
+                 sample_size=_SAMPLE_SIZE):
+        self.spec = spec
+        self.fp = fp
+        self.output = output
+        self.header = header
+        self.sample_size = sample_size
+        self._sample = [] if output == 'table' else None
+        self._buffer = []
+        self._buffered = 0
+        self._rows = 0
+
+    def _emit(self, data):
+        self._buffer.append(data)
+        self._buffered += len(data)
+        if self._buffered >= _BUFFER_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write buffered output."""
+        if self._buffer:
+            self.fp.write(''.join(self._buffer))
+            self.fp.flush()
+            self._buffer, self._buffered = [], 0
+
+    def _size(self):
+        """Size the columns from the sample and write it."""
+        widths = []
+        for (field, width, fmter) in self.spec:
+            values = [len(fmter(item.get(field, '')))
+                      for item in self._sample]
+            widths.append(max([width, len(field)] + [
+                        min(value, _MAX_WIDTH) for value in values]))
+        self.spec = [(field, width, fmter) for ((field, w, fmter), width)
+                     in zip(self.spec, widths)]
+        if self.header:
+            self._emit(fmt(self.spec, dict(
+                        (field, field) for (field, w, f) in self.spec)) + '\n')
+            self._emit(header(self.spec) + '\n')
+        sample, self._sample = self._sample, None
+        for item in sample:
+            self._emit(fmt(self.spec, item) + '\n')
+
+    def write(self, item):
+        """Write a row for `item`."""
+        if self.output == 'table':
+            if self._sample is not None:
+                self._sample.append(item)
+                if len(self._sample) >= self.sample_size:
+                    self._size()
+            else:
+                self._emit(fmt(self.spec, item) + '\n')
+        elif self.output == 'json':
+            self._emit(('[\n' if not self._rows else ',\n')
+                       + json.dumps(item, sort_keys=True))
+        elif self.output == 'jsonl':
+            self._emit(json.dumps(item, sort_keys=True) + '\n')
+        elif self.output == 'yaml':
+            import yaml
+            self._emit(yaml.safe_dump([item], default_flow_style=False))
+        elif self.output == 'tsv':
+            if not self._rows:
+                self._emit('\t'.join(field for (field, w, f)
+                                     in self.spec) + '\n')
+            self._emit('\t'.join(
+                    _tsv_escape(fmter(item.get(field, '')))
+                    for (field, width, fmter) in self.spec) + '\n')
+        self._rows += 1
+
+    def close(self):
+        """Write what remains of the listing."""
+        if self._sample is not None:
+            self._size()
+        if self.output == 'json':
+            self._emit('[]\n' if not self._rows else '\n]\n')
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, type, value, traceback):
+        self.close()
@@ -0,0 +1,230 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Matching of paths against ignore patterns, with the same semantics
+as `.gitignore` files:
+
+- a pattern without a slash matches a file or directory with that name
+  anywhere in the tree; a pattern with a slash is anchored to the
+  root of the tree (a leading slash is dropped);
+
+- `*` and `?` match anything but a slash, `[...]` matches a character
+  class, `**/` matches any number of directories and a trailing `/**`
+  matches everything inside a directory;
+
+- a pattern ending with a slash only matches directories;
+
+- a pattern starting with `!` re-includes what an earlier pattern
+  excluded.  The last matching pattern decides.
+
+Patterns are compiled up front.  Consecutive patterns that share
+negation and directory-only flags are merged: plain names and `*.ext`
+patterns go into sets, and the rest into one regular expression for
+names and one for anchored paths.  Matching a path costs a few
+lookups no matter how many patterns there are.
+"""
+
+import posixpath
+import re
+
+
+def _translate(pattern):
+    """Translate the glob `pattern` into a regular expression that
+    matches a complete relative path.
+    """
+    i, n, res = 0, len(pattern), []
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+            res.append('(?:.*/)?')
+            i += 3
+            continue
+        elif (pattern.startswith('**', i) and i + 2 == n
+              and (i == 0 or pattern[i - 1] == '/')):
+            res.append('.*')
+            i += 2
+            continue
+        i += 1
+        if c == '*':
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '\\' and i < n:
+            res.append(re.escape(pattern[i]))
+            i += 1
+        elif c == '[':
+            j = i
+            if j < n and pattern[j] in '!^':
+                j += 1
+            if j < n and pattern[j] == ']':
+                j += 1
+            while j < n and pattern[j] != ']':
+                j += 1
+            if j >= n:
+                res.append('\\[')
+            else:
+                stuff = pattern[i:j].replace('\\', '\\\\')
+                i = j + 1
+                if stuff[0] in '!^':
+                    stuff = '^' + stuff[1:]
+                res.append('[%s]' % (stuff,))
+        else:
+            res.append(re.escape(c))
+    return ''.join(res)
+
+
+_MAGIC = re.compile(r'[*?\[\\]')
+
+
+class _Rule(object):
+    """A parsed pattern."""
+
+    def __init__(self, line):
+        self.negate = False
+        self.dir_only = False
+        if line.startswith('!'):
+            self.negate = True
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        if line.endswith('/'):
+            self.dir_only = True
+            line = line.rstrip('/')
+        self.anchored = '/' in line
+        self.pattern = line.lstrip('/')
+
+    @property
+    def literal_name(self):
+        """The name this rule matches, if it is a plain name that may
+        match at any depth, otherwise `None`.
+        """
+        if self.anchored or _MAGIC.search(self.pattern):
+            return None
+        return self.pattern
+
+    @property
+    def extension(self):
+        """The extension this rule matches if it is a `*.ext` pattern
+        that may match at any depth, otherwise `None`.
+        """
+        if (self.anchored or not self.pattern.startswith('*.')
+                or _MAGIC.search(self.pattern[1:])
+                or '.' in self.pattern[2:]):
+            return None
+        return self.pattern[1:]
+
+
+def _compile(regexes):
+    if not regexes:
+        return None
+    return re.compile('(?:%s)\\Z' % ('|'.join(regexes),), re.S)
+
+
+class _Group(object):
+    """Consecutive rules that share negation and directory-only
+    flags.  Rules that may match at any depth are matched against the
+    name only; anchored rules against the whole path.
+    """
+
+    def __init__(self, negate, dir_only, rules):
+        self.negate = negate
+        self.dir_only = dir_only
+        self.names = set()
+        self.extensions = set()
+        name_regexes, path_regexes = [], []
+        for rule in rules:
+            if rule.literal_name is not None:
+                self.names.add(rule.literal_name)
+            elif rule.extension is not None:
+                self.extensions.add(rule.extension)
+            elif rule.anchored:
+                path_regexes.append(_translate(rule.pattern))
+            else:
+                name_regexes.append(_translate(rule.pattern))
+        self.name_regex = _compile(name_regexes)
+        self.path_regex = _compile(path_regexes)
+
+    def match(self, path, name, ext, is_dir):
+        if self.dir_only and not is_dir:
+            return False
+        return (name in self.names
+                or (ext and ext in self.extensions)
+                or (self.name_regex is not None
+                    and self.name_regex.match(name) is not None)
+                or (self.path_regex is not None
+                    and self.path_regex.match(path) is not None))
+
+
+def parse_lines(lines):
+    """Return the patterns of the lines of an ignore file, skipping
+    blank lines and comments.
+    """
+    patterns = []
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if not line.endswith('\\ '):
+            line = line.rstrip()
+        if line and not line.startswith('#'):
+            patterns.append(line)
+    return patterns
+
+
+class IgnoreMatcher(object):
+    """Compiled set of ignore patterns::
+
+       >>> matcher = IgnoreMatcher(['*.pyc', 'build/', '!build/keep'])
+       >>> matcher.match('lib/foo.pyc')
+       True
+       >>> matcher.match('build', is_dir=True)
+       True
+
+    Paths are relative to the root of the tree and use `/` as
+    separator.  A path is not matched against the patterns of its
+    parent directories; walk the tree top-down and stop descending
+    into ignored directories.
+    """
+
+    def __init__(self, patterns):
+        self.groups = []
+        rules = [_Rule(pattern) for pattern in patterns]
+        start = 0
+        for i in range(1, len(rules) + 1):
+            if (i == len(rules)
+                    or (rules[i].negate, rules[i].dir_only)
+                       != (rules[start].negate, rules[start].dir_only)):
+                self.groups.append(_Group(rules[start].negate,
+                                          rules[start].dir_only,
+                                          rules[start:i]))
+                start = i
+        self.groups.reverse()
+
+    def match(self, path, is_dir=False):
+        """Return true if `path` should be ignored."""
+        name = posixpath.basename(path)
+        # unlike splitext, this gives dotfiles such as `.pyc` an
+        # extension, as `*.pyc` matches them.
+        dot = name.rfind('.')
+        ext = name[dot:] if dot != -1 else ''
+        for group in self.groups:
+            if group.match(path, name, ext, is_dir):
+                return not group.negate
+        return False
+
+    def filter(self, dirpath, names, is_dir=False):
+        """Return the names in directory `dirpath` that should not be
+        ignored.
+        """
+        prefix = dirpath + '/' if dirpath else ''
+        return [name for name in names
+                if not self.match(prefix + name, is_dir)]
@@ -0,0 +1,189 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""The file index caches the digest of every file in an application
+root, so that the tag of a build context can be computed without
+reading files that have not changed since the last build.
+
+The index lives in `.gilliam/index` in the application root and is
+keyed by the path of the file relative to the root.  Every entry
+holds the size, modification time (in nanoseconds) and inode of the
+file when it was hashed, together with its digest.  A cached digest
+is only used if all three still match.
+
+Like git, entries that were modified at the same time or after the
+index was written are considered *racy* and are always rehashed,
+since a change within the same timestamp granularity would otherwise
+go unnoticed.
+"""
+
+from contextlib import contextmanager
+from functools import partial
+import errno
+import hashlib
+import json
+import os
+import threading
+
+
+_INDEX_VERSION = 1
+
+_lock = threading.Lock()
+_locks = {}
+
+
+def _mtime_ns(st):
+    return int(st.st_mtime * 1000000000)
+
+
+def hash_file(path):
+    """Return the hex digest of the content of the file at `path`."""
+    h = hashlib.md5()
+    with open(path, 'rb') as fp:
+        for data in iter(partial(fp.read, 64 * 1024), ''):
+            h.update(data)
+    return h.hexdigest()
+
+
+class FileIndex(object):
+    """Index of file digests for an application root.
+
+    Use `open` to get hold of the index for a directory; it makes
+    sure that only one thread at a time use the index of a directory
+    and writes the index back to disk when done::
+
+       with FileIndex.open(approot) as index:
+           digest = index.digest('app.py')
+
+    """
+
+    def __init__(self, rootdir, entries=None, written_ns=0):
+        self.rootdir = rootdir
+        self.entries = entries if entries is not None else {}
+        self.written_ns = written_ns
+        self.hits = 0
+        self.misses = 0
+        self._seen = set()
+        self._dirty = False
+
+    @property
+    def path(self):
+        return os.path.join(self.rootdir, '.gilliam', 'index')
+
+    def digest(self, relpath, st=None):
+        """Return the digest of the file at `relpath`, hashing the
+        file only if it has changed since it was indexed.
+
+        :param st: (Optional) Result of a recent `stat` of the file.
+        """
+        path = os.path.join(self.rootdir, relpath)
+        if st is None:
+            st = os.stat(path)
+        key = [st.st_size, _mtime_ns(st), st.st_ino]
+        self._seen.add(relpath)
+
+        entry = self.entries.get(relpath)
+        if (entry is not None and entry[:3] == key
+                and key[1] < self.written_ns):
+            self.hits += 1
+            return entry[3]
+
+        self.misses += 1
+        digest = hash_file(path)
+        self.entries[relpath] = key + [digest]
+        self._dirty = True
+        return digest
+
+    def verify(self):
+        """Rehash every indexed file and return the paths that have a
+        stale digest in the index.
+        """
+        stale = []
+        for relpath, entry in sorted(self.entries.items()):
+            path = os.path.join(self.rootdir, relpath)
+            try:
+                digest = hash_file(path)
+            except EnvironmentError as err:
+                if err.errno != errno.ENOENT:
+                    raise
+                digest = None
+            if digest != entry[3]:
+                stale.append(relpath)
+        return stale
+
+    def clear(self):
+        """Forget all entries."""
+        self.entries = {}
+        self._dirty = True
+
+    def _read(self):
+        """Read the index from disk.  A missing or unreadable index
+        results in an empty index.
+        """
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+                st = os.fstat(fp.fileno())
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return
+        except ValueError:
+            return
+        if data.get('version') != _INDEX_VERSION:
+            return
+        self.entries = data.get('entries', {})
+        self.written_ns = _mtime_ns(st)
+
+    def write(self):
+        """Write the index to disk, dropping entries for files that
+        have not been seen since the index was read.
+        """
+        if self._seen:
+            self.entries = {relpath: entry for (relpath, entry)
+                            in self.entries.items()
+                            if relpath in self._seen}
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as fp:
+            json.dump({'version': _INDEX_VERSION, 'entries': self.entries},
+                      fp, separators=(',', ':'))
+        os.rename(tmp, self.path)
+        self._dirty = False
+
+    @classmethod
+    def make(cls, rootdir):
+        """Read the index for `rootdir` from disk."""
+        index = cls(rootdir)
+        index._read()
+        return index
+
+    @classmethod
+    @contextmanager
+    def open(cls, rootdir):
+        """Context manager that yields the index for `rootdir` and
+        writes it back to disk if it was changed.
+        """
+        rootdir = os.path.realpath(rootdir)
+        with _lock:
+            lock = _locks.setdefault(rootdir, threading.Lock())
+        with lock:
+            index = cls.make(rootdir)
+            yield index
+            if index._dirty:
+                index.write()
@@ -0,0 +1,198 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Selection of executors to build services and run commands on.
+
+The strategy is picked with the `executor_placement` stage variable:
+
+- `random` picks any executor.
+
+- `affinity` (the default) prefers the executor that last built the
+  service, since it still has the layers and buildpack cache of the
+  previous build.  Otherwise it picks the least loaded executor,
+  going by the `load` that executors publish in the service registry.
+  The services of one deploy are spread over distinct executors as
+  far as there are executors to go around.
+
+Which executor built which service is kept in
+`~/.gilliam/cache/<stage>/executors.json`.
+
+Commands that run an image can instead prefer executors that already
+have the image (see `prefer_image`), so that the command does not
+wait for the image to be pulled.
+"""
+
+import errno
+import json
+import logging
+import os
+import random
+import threading
+
+
+log = logging.getLogger(__name__)
+
+
+class ExecutorAffinity(object):
+    """Record of the executor that last built each service."""
+
+    def __init__(self, path):
+        self.path = path
+        self.executors = {}
+        self._lock = threading.Lock()
+
+    def get(self, formation, service):
+        """Return the instance name of the executor that last built
+        `service`, or `None`.
+        """
+        with self._lock:
+            return self.executors.get('%s/%s' % (formation, service))
+
+    def put(self, formation, service, executor):
+        with self._lock:
+            key = '%s/%s' % (formation, service)
+            if self.executors.get(key) == executor:
+                return
+            self.executors[key] = executor
+            if self.path is not None:
+                self._write()
+
+    def _read(self):
+        try:
+            with open(self.path) as fp:
+                self.executors = json.load(fp)
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                raise
+        except ValueError:
+            pass
+
+    def _write(self):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as fp:
+            json.dump(self.executors, fp, separators=(',', ':'))
+        os.rename(tmp, self.path)
+
+    @classmethod
+    def make(cls, basedir, stage):
+        """Read the record of `stage`.  If `basedir` is `None`, the
+        record is only kept in memory.
+        """
+        if basedir is None:
+            return cls(None)
+        affinity = cls(os.path.join(basedir, stage or 'default',
+                                    'executors.json'))
+        affinity._read()
+        return affinity
+
+
+def _load(executor):
+    """Return the load that `executor` publishes, or zero."""
+    try:
+        return float(executor.get('load') or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+class RandomPlacement(object):
+    """Pick any executor."""
+
+    def __init__(self, formation, affinity):
+        self.formation = formation
+        self.affinity = affinity
+
+    def select(self, service, executors):
+        """Return the executor, out of the registry entries in
+        `executors`, to build `service` on.
+        """
+        return random.choice(executors)
+
+    def built(self, service, executor):
+        """Record that `service` was built on `executor`."""
+        self.affinity.put(self.formation, service, executor['instance'])
+
+
+class AffinityPlacement(RandomPlacement):
+    """Prefer the executor that last built the service, and otherwise
+    the least loaded executor that no other service of this deploy is
+    using.
+    """
+
+    def __init__(self, formation, affinity):
+        RandomPlacement.__init__(self, formation, affinity)
+        self.claims = {}
+        self._lock = threading.Lock()
+
+    def select(self, service, executors):
+        with self._lock:
+            previous = self.affinity.get(self.formation, service)
+            for executor in executors:
+                if (executor['instance'] == previous
+                        and not self.claims.get(previous)):
+                    log.debug("%s: building on %s again" % (
+                            service, previous))
+                    break
+            else:
+                executor = min(executors, key=lambda e: (
+                        self.claims.get(e['instance'], 0), _load(e),
+                        random.random()))
+            self.claims[executor['instance']] = self.claims.get(
+                executor['instance'], 0) + 1
+            return executor
+
+
+def image_holders(instances, image):
+    """Return the names of the executors that run one of
+    `instances` from `image`, and so have the image.
+    """
+    return set(instance['assigned_to'] for instance in instances
+               if instance.get('image') == image
+               and instance.get('assigned_to'))
+
+
+def has_image(executor, image, holders=()):
+    """Return true if `executor` is known to have `image`, either
+    because it is one of `holders` or because it lists the image in
+    the `images` it publishes in the service registry.
+    """
+    return (executor['instance'] in holders
+            or image in (executor.get('images') or ()))
+
+
+def prefer_image(executors, image, holders=()):
+    """Return the least loaded executor that has `image`, or the
+    least loaded executor if none of them has it.
+    """
+    return min(executors, key=lambda e: (
+            not has_image(e, image, holders), _load(e), random.random()))
+
+
+PLACEMENTS = {'random': RandomPlacement, 'affinity': AffinityPlacement}
+
+
+def make(name, formation, affinity):
+    """Create the placement strategy called `name`.
+
+    :raises: `ValueError` if there is no such strategy.
+    """
+    try:
+        cls = PLACEMENTS[name]
+    except KeyError:
+        raise ValueError("unknown executor placement: %s" % (name,))
+    return cls(formation, affinity)
@@ -0,0 +1,134 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Connection pools for outbound HTTP.
+
+Requests are sorted into *targets*: the formation of a service name
+(`scheduler`, `executor`, `router`, ...), `registry` for image
+registries or `service-registry` for the nodes of the service
+registry.  Every target has its own `HTTPAdapter`, with a pool size
+that can be set per target using the `pool_sizes` stage variable::
+
+   GILLIAM_POOL_SIZES=executor=32,registry=4
+
+Targets that are not listed get the size of `default`.  Since pools
+hold on to connections between requests, the client talks to each
+host over a handful of kept-alive connections instead of setting up a
+new connection (and TLS session) for every request.
+"""
+
+import logging
+import threading
+
+from requests.adapters import BaseAdapter, HTTPAdapter
+from requests.compat import urlparse
+
+
+log = logging.getLogger(__name__)
+
+DEFAULT_POOL_SIZES = {'default': 10, 'executor': 16, 'registry': 4}
+
+# number of hosts a target keeps pools for.  executor instances are
+# separate hosts.
+_POOL_HOSTS = 16
+
+
+def target_of(hostname):
+    """Return the target of requests to `hostname`."""
+    if hostname and hostname.endswith('.service'):
+        parts = hostname.split('.')
+        if len(parts) >= 3:
+            return parts[-2]
+    return 'default'
+
+
+class Pools(object):
+    """The connection pools of a client, one adapter per target."""
+
+    def __init__(self, sizes=None):
+        self.sizes = dict(DEFAULT_POOL_SIZES)
+        self.sizes.update(sizes or {})
+        self.adapters = {}
+        self._lock = threading.Lock()
+
+    def size(self, target):
+        return self.sizes.get(target, self.sizes['default'])
+
+    def adapter(self, target):
+        """Return the adapter for `target`."""
+        with self._lock:
+            adapter = self.adapters.get(target)
+            if adapter is None:
+                adapter = self.adapters[target] = HTTPAdapter(
+                    pool_connections=_POOL_HOSTS,
+                    pool_maxsize=self.size(target))
+            return adapter
+
+    def stats(self):
+        """Return a list of `(target, host, connections, requests)`
+        tuples for every pool.  A pool that served more requests than
+        it opened connections reused connections.
+        """
+        stats = []
+        with self._lock:
+            for target, adapter in sorted(self.adapters.items()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools[key]
+                    stats.append((target, '%s:%s' % (pool.host, pool.port),
+                                  pool.num_connections, pool.num_requests))
+        return stats
+
+    def close(self):
+        """Log statistics of and close all pools."""
+        for (target, host, connections, requests) in self.stats():
+            log.debug("%s %s: %d requests over %d connections" % (
+                    target, host, requests, connections))
+        with self._lock:
+            for adapter in self.adapters.values():
+                adapter.close()
+            self.adapters = {}
+
+
+class TargetAdapter(BaseAdapter):
+    """Adapter that sends every request through an adapter of its
+    target, as created by `factory` from the target's pooled adapter.
+    Used to put a resolving adapter in front of the pools, since the
+    target is only known before the host name is resolved.
+    """
+
+    def __init__(self, pools, factory):
+        BaseAdapter.__init__(self)
+        self.pools = pools
+        self.factory = factory
+        self._adapters = {}
+        self._lock = threading.Lock()
+
+    def _adapter(self, target):
+        with self._lock:
+            adapter = self._adapters.get(target)
+            if adapter is None:
+                adapter = self._adapters[target] = self.factory(
+                    self.pools.adapter(target))
+            return adapter
+
+    def send(self, request, *args, **kwargs):
+        target = target_of(urlparse(request.url).hostname)
+        return self._adapter(target).send(request, *args, **kwargs)
+
+    def close(self):
+        with self._lock:
+            for adapter in self._adapters.values():
+                adapter.close()
+            self._adapters = {}
@@ -0,0 +1,191 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Snapshot of service registry lookups that is shared between
+invocations of the client.
+
+Every lookup of a formation in the service registry is written to
+`~/.gilliam/cache/<stage>/registry.json`, and is used instead of
+asking the registry again until it is older than the TTL.  Since names
+such as `api.scheduler.service` are resolved from the instances of a
+formation, this also covers resolution of host names.
+
+If a connection to an address that was resolved from the snapshot
+fails, the formation is dropped from the snapshot and the request is
+retried with fresh data from the registry.
+"""
+
+import errno
+import json
+import logging
+import os
+import socket
+import threading
+
+from gilliam.adapter import ResolveAdapter
+from requests.compat import urlparse
+from requests.exceptions import ConnectionError
+
+
+log = logging.getLogger(__name__)
+
+_SNAPSHOT_VERSION = 1
+
+# HTTP methods that are safe to send again if a connection fails.
+_RETRY_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+class RegistrySnapshot(object):
+    """On-disk snapshot of the instances of formations."""
+
+    def __init__(self, path, ttl, clock):
+        self.path = path
+        self.ttl = ttl
+        self.clock = clock
+        self.formations = {}
+        # formations that were served from the snapshot, rather than
+        # fetched from the registry by this process.
+        self.reused = set()
+        self._lock = threading.Lock()
+
+    def get(self, form_name):
+        """Return the instances of `form_name` or `None` if it is not
+        in the snapshot or has expired.
+        """
+        with self._lock:
+            entry = self.formations.get(form_name)
+            if entry is None or self.clock.time() - entry['time'] > self.ttl:
+                return None
+            self.reused.add(form_name)
+            return entry['instances']
+
+    def put(self, form_name, instances):
+        """Store the instances of `form_name`."""
+        with self._lock:
+            self.formations[form_name] = {'time': self.clock.time(),
+                                          'instances': instances}
+            self.reused.discard(form_name)
+            self._write()
+
+    def invalidate(self, form_name):
+        """Drop `form_name` from the snapshot.
+
+        :returns: `True` if the formation was served from the
+            snapshot, and fresh data might help.
+        """
+        with self._lock:
+            reused = form_name in self.reused
+            self.reused.discard(form_name)
+            if self.formations.pop(form_name, None) is not None:
+                self._write()
+            return reused
+
+    def _read(self):
+        try:
+            with open(self.path) as fp:
+                data = json.load(fp)
+        except EnvironmentError as err:
+            if err.errno != errno.ENOENT:
+                raise
+            return
+        except ValueError:
+            return
+        if data.get('version') != _SNAPSHOT_VERSION:
+            return
+        self.formations = data.get('formations', {})
+
+    def _write(self):
+        try:
+            os.makedirs(os.path.dirname(self.path))
+        except OSError as err:
+            if err.errno != errno.EEXIST:
+                raise
+        tmp = '%s.%d' % (self.path, os.getpid())
+        with open(tmp, 'w') as fp:
+            json.dump({'version': _SNAPSHOT_VERSION,
+                       'formations': self.formations},
+                      fp, separators=(',', ':'))
+        os.rename(tmp, self.path)
+
+    @classmethod
+    def make(cls, basedir, stage, ttl, clock):
+        """Read the snapshot of `stage`."""
+        snapshot = cls(os.path.join(basedir, stage or 'default',
+                                    'registry.json'), ttl, clock)
+        snapshot._read()
+        return snapshot
+
+
+class SnapshotRegistryClient(object):
+    """Service registry client that answers formation queries from a
+    `RegistrySnapshot` when it can, and otherwise asks `client`.
+    """
+
+    def __init__(self, client, snapshot):
+        self.client = client
+        self.snapshot = snapshot
+
+    def query_formation(self, form_name, factory=dict):
+        """Query all instances of a formation.  Like the method of
+        the service registry client, yields `(instance name, data)`
+        for each instance.
+        """
+        instances = self.snapshot.get(form_name)
+        if instances is None:
+            instances = dict(self.client.query_formation(form_name))
+            self.snapshot.put(form_name, instances)
+        for key, data in instances.items():
+            yield (key, factory(data))
+
+    def invalidate(self, form_name):
+        """See `RegistrySnapshot.invalidate`."""
+        return self.snapshot.invalidate(form_name)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def _formation(hostname):
+    """Return the formation that `hostname` is resolved from, or
+    `None` if it is not a service name.
+    """
+    if not hostname or not hostname.endswith('.service'):
+        return None
+    parts = hostname.split('.')
+    return parts[-2] if len(parts) >= 3 else None
+
+
+class SnapshotResolveAdapter(ResolveAdapter):
+    """Resolving adapter that drops the formation of the target from
+    the registry snapshot when a connection fails, and retries the
+    request if it is safe to do so.
+    """
+
+    def __init__(self, original, resolver, registry):
+        ResolveAdapter.__init__(self, original, resolver)
+        self.registry = registry
+
+    def send(self, request, *args, **kwargs):
+        url = request.url
+        try:
+            return ResolveAdapter.send(self, request, *args, **kwargs)
+        except (ConnectionError, socket.error):
+            form_name = _formation(urlparse(url).hostname)
+            if (form_name is None
+                    or not self.registry.invalidate(form_name)
+                    or request.method not in _RETRY_METHODS):
+                raise
+            log.debug("%s: connection failed; resolving again" % (url,))
+            request.prepare_url(url, {})
+            return ResolveAdapter.send(self, request, *args, **kwargs)
@@ -0,0 +1,260 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Rolling migration of a formation to a release, driven by the
+client.
+
+Every service of the release is rolled separately.  If the service
+has `N` live instances in older releases, the rollout scales up the
+new release and scales down the old ones in steps, keeping within two
+budgets:
+
+- at most `N + max_surge` instances exist at any time, and
+
+- at least `N - max_unavailable` instances are healthy.
+
+An instance of the new release is healthy when it is running and has
+registered with the service registry.  Instances of older releases
+are only removed once enough new instances are healthy, so the
+rollout goes as fast as the cluster brings up new instances.
+
+A service that has no instances in older releases is started with
+one instance, like `launch --scale` does, and the instances of
+services that are not part of the release are removed.
+"""
+
+import logging
+import time
+
+from . import trace, util
+from .watch import InstanceWatch, changed, converged, is_live
+
+
+log = logging.getLogger(__name__)
+
+# longest time to wait for the formation to settle after a call to
+# `scale`, before calling it again.
+_SCALE_TIMEOUT = 60
+
+# longest time to wait for running instances to register.
+_HEALTH_TIMEOUT = 300
+
+# number of instances to start of a service that has none.
+_INITIAL_SCALE = 1
+
+
+class RolloutError(Exception):
+    pass
+
+
+class Rollout(object):
+    """Rolling migration of `formation` to `release`.
+
+    :param registry: Service registry client used to check that new
+        instances have registered.  Should not be cached.
+
+    :param max_surge: Number or percentage of instances that may be
+        created above the desired number.  Defaults to none if
+        `max_unavailable` allows any instances to be unavailable,
+        otherwise to 25%.
+
+    :param max_unavailable: Number or percentage of instances that
+        may be unavailable during the rollout.  Defaults to none.
+
+    :param batch_size: (Optional) Most instances to add or remove in
+        one step.
+
+    :param rate: (Optional) Least number of seconds between steps.
+    """
+
+    def __init__(self, scheduler, registry, formation, release,
+                 max_surge=None, max_unavailable=None, batch_size=None,
+                 rate=0, clock=time, poll_interval=(1, 5)):
+        self.scheduler = scheduler
+        self.registry = registry
+        self.formation = formation
+        self.release = release
+        self.max_surge = max_surge
+        self.max_unavailable = max_unavailable
+        self.batch_size = batch_size
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self.watch = InstanceWatch(scheduler, formation, clock,
+                                   poll_interval)
+        self.throttle = util.Throttle(rate, clock)
+
+    def _live(self, service):
+        """Return the number of live instances of `service` per
+        release.
+        """
+        counts = {}
+        for instance in self.watch.instances.values():
+            if instance.get('service') == service and is_live(instance):
+                release = instance.get('release')
+                if release is None:
+                    # not part of a release (spawned by hand); the
+                    # rollout leaves it alone.
+                    continue
+                counts[release] = counts.get(release, 0) + 1
+        return counts
+
+    def _registered(self):
+        """Return the `(service, instance)` pairs of the instances
+        that are registered with the service registry.
+        """
+        return set((data.get('service'), data.get('instance'))
+                   for (key, data)
+                   in self.registry.query_formation(self.formation))
+
+    def _healthy(self, service):
+        """Return the number of instances of `service` in the new
+        release that are running and registered.
+        """
+        registered = self._registered()
+        return sum(1 for instance in self.watch.instances.values()
+                   if instance.get('service') == service
+                   and instance.get('release') == self.release
+                   and instance.get('state') == 'running'
+                   and (service, instance['name']) in registered)
+
+    def _scale(self, release, service, num):
+        log.debug("scale %s of release %s to %d" % (service, release, num))
+        with trace.span('rollout step', service=service, release=release,
+                        scale=num):
+            while True:
+                before = self.watch.snapshot()
+                if not self.scheduler.scale(self.formation, release,
+                                            {service: num}):
+                    break
+                # wait for the call to take effect before calling
+                # again.
+                self.watch.wait(changed(before), _SCALE_TIMEOUT,
+                                refresh=True)
+
+    def _wait_healthy(self, service, num):
+        """Wait until at least `num` new instances of `service` are
+        healthy, or until the formation has settled without getting
+        there.  Return the number of healthy instances.
+        """
+        interval, max_interval = self.poll_interval
+        deadline = self.clock.time() + _HEALTH_TIMEOUT
+        while True:
+            self.watch.wait(converged, _SCALE_TIMEOUT)
+            healthy = self._healthy(service)
+            if healthy >= num:
+                return healthy
+            running = sum(1 for instance in self.watch.instances.values()
+                          if instance.get('service') == service
+                          and instance.get('release') == self.release
+                          and instance.get('state') == 'running')
+            if ((running < num and converged(self.watch.instances))
+                    or self.clock.time() > deadline):
+                # instances failed to start or to register; give up
+                # on them.
+                return healthy
+            self.clock.sleep(interval)
+            interval = min(interval * 2, max_interval)
+
+    def _roll_service(self, service):
+        self.watch.wait(converged, _SCALE_TIMEOUT)
+        counts = self._live(service)
+        new = counts.pop(self.release, 0)
+        old = counts
+        desired = max(sum(old.values()), new)
+        if not old:
+            if new < _INITIAL_SCALE:
+                log.info("%s: starting %d instances" % (
+                        service, _INITIAL_SCALE))
+                self.throttle.wait()
+                self._scale(self.release, service, _INITIAL_SCALE)
+                self._wait_healthy(service, _INITIAL_SCALE)
+            return
+
+        unavailable = (0 if self.max_unavailable is None else
+                       util.parse_budget(self.max_unavailable, desired,
+                                         False))
+        if self.max_surge is not None:
+            surge = util.parse_budget(self.max_surge, desired, True)
+        else:
+            surge = (0 if unavailable > 0 else
+                     util.parse_budget('25%', desired, True))
+        if surge <= 0 and unavailable <= 0:
+            raise RolloutError("max surge and max unavailable cannot "
+                               "both be zero")
+        batch = self.batch_size or desired
+
+        log.info("%s: replacing %d instances (surge %d, unavailable %d)" % (
+                service, sum(old.values()), surge, unavailable))
+        healthy = self._healthy(service)
+        while sum(old.values()) or new < desired:
+            progress = False
+
+            add = min(desired + surge - (new + sum(old.values())),
+                      desired - new, batch)
+            if add > 0:
+                self.throttle.wait()
+                new += add
+                self._scale(self.release, service, new)
+                healthy = self._wait_healthy(service, new)
+                progress = True
+
+            remove = min(healthy + sum(old.values())
+                         - (desired - unavailable),
+                         sum(old.values()), batch)
+            if remove > 0:
+                if add <= 0:
+                    self.throttle.wait()
+                # remove instances of the oldest releases first.
+                for release in sorted(old, key=int):
+                    count = min(remove, old[release])
+                    if not count:
+                        continue
+                    old[release] -= count
+                    remove -= count
+                    self._scale(release, service, old[release])
+                progress = True
+
+            if not progress:
+                raise RolloutError(
+                    "%s: %d of %d new instances are healthy; cannot "
+                    "make progress" % (service, healthy, new))
+
+    def _retire(self, services):
+        """Remove the instances of `services`, which are not part of
+        the release.
+        """
+        for service in sorted(services):
+            counts = self._live(service)
+            log.info("%s: removing %d instances" % (
+                    service, sum(counts.values())))
+            for release in sorted(counts, key=int):
+                self.throttle.wait()
+                self._scale(release, service, 0)
+
+    def run(self):
+        """Roll out the release."""
+        release = self.scheduler.release(self.formation, self.release)
+        if release is None:
+            raise RolloutError("%s: no such release" % (self.release,))
+        try:
+            for service in sorted(release['services']):
+                self._roll_service(service)
+            self.watch.wait(converged, _SCALE_TIMEOUT)
+            services = set(instance.get('service') for instance
+                           in self.watch.instances.values()
+                           if is_live(instance)
+                           and instance.get('release') is not None)
+            self._retire(services - set(release['services']))
+        finally:
+            self.watch.close()
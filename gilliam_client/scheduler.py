@@ -14,6 +14,8 @@
 
 import json
 
+from gilliam import SchedulerClient as _SchedulerClient
+from gilliam import errors as gilliam_errors
 from requests.exceptions import HTTPError
 
 from . import errors, util
@@ -98,3 +100,145 @@ class Scheduler(object):
             raise
         else:
             return response.json()
+
+
+class SchedulerClient(_SchedulerClient):
+    """Scheduler client with a few additions to the one in the
+    `gilliam` package.
+
+    :param prefetch: (Optional) Number of pages of a collection to
+        fetch ahead of the consumer when listing releases, instances
+        and formations.
+
+    :param cache: (Optional) Callable that returns the
+        `ReleaseCache` of a formation.  If given, releases are
+        listed from the cache and only releases that are not in the
+        cache are fetched from the scheduler.
+    """
+
+    # number of releases that are fetched one by one when bringing
+    # the release cache up to date, before giving up and listing
+    # all releases.
+    _PROBE_LIMIT = 10
+
+    def __init__(self, client, host='api.scheduler.service', port=80,
+                 prefetch=1, cache=None):
+        _SchedulerClient.__init__(self, client, host, port)
+        self.prefetch = prefetch
+        self.cache = cache
+
+    def _traverse(self, fmt, *args):
+        return util.traverse_collection(
+            self.client, self._url(fmt, *args), self.prefetch)
+
+    def releases(self, formation):
+        """Return an iterator over all releases of `formation`.
+
+        If the client has a release cache, the releases are ordered by
+        name.
+        """
+        if self.cache is None:
+            return self._traverse('/formation/%s/release', formation)
+        cache = self.cache(formation)
+        if not self._update_cache(cache, formation):
+            cache.clear()
+            for release in self._traverse('/formation/%s/release',
+                                          formation):
+                cache.add(release)
+        cache.write()
+        return iter(cache.sorted())
+
+    def latest_release(self, formation):
+        """Return the release of `formation` with the highest name, or
+        `None` if it has no releases.
+
+        If the client has a release cache, only the releases that
+        follow the latest cached release are fetched.
+        """
+        if self.cache is not None:
+            cache = self.cache(formation)
+            if self._update_cache(cache, formation):
+                cache.write()
+                return cache.latest()
+        releases = list(self.releases(formation))
+        if not releases:
+            return None
+        return max(releases, key=lambda release: int(release['name']))
+
+    def _update_cache(self, cache, formation):
+        """Fetch the releases that follow the latest cached release.
+
+        :returns: `False` if the cache is empty, does not match the
+            scheduler, or is too far behind, and the releases should
+            be listed instead.
+        """
+        latest = cache.latest()
+        if latest is None:
+            return False
+        # make sure that the formation has not been re-created since
+        # the cache was written.
+        if self.release(formation, latest['name']) != latest:
+            return False
+        for i in range(self._PROBE_LIMIT):
+            release = self.release(formation,
+                                   str(int(latest['name']) + 1))
+            if release is None:
+                return True
+            cache.add(release)
+            latest = release
+        return False
+
+    def instances(self, formation):
+        """Return an iterator over all instances of `formation`."""
+        return self._traverse('/formation/%s/instances', formation)
+
+    def formations(self):
+        """Return an iterator over all formations."""
+        return self._traverse('/formation')
+
+    def watch_instances(self, formation):
+        """Open a stream of changes to the instances of `formation`.
+
+        Every message on the returned websocket is an instance as
+        JSON.  Instances that are gone are sent in state `removed`.
+        """
+        url = self._url('/formation/%s/instances', formation)
+        response = self.client.get(url.replace('http://', 'ws://'),
+                                   params={'watch': '1'})
+        response.raise_for_status()
+        return response.websocket
+
+    def release(self, formation, name):
+        """Return release `name` of `formation`, or `None` if there is
+        no such release.
+        """
+        try:
+            response = self.client.get(self._url(
+                    '/formation/%s/release/%s', formation, name))
+            if response.status_code == 404:
+                return None
+            response.raise_for_status()
+            return response.json()
+        except Exception, err:
+            gilliam_errors.convert_error(err)
+
+    def create_release(self, formation, name, author, message,
+                       services):
+        """Create release `name` of `formation`.
+
+        :raises: ConflictError if the release already exists.
+        """
+        request = {'name': name, 'author': author, 'message': message,
+                   'services': services}
+        try:
+            response = self.client.post(
+                self._url('/formation/%s/release', formation),
+                data=json.dumps(request))
+            if response.status_code == 409:
+                raise errors.ConflictError(name)
+            response.raise_for_status()
+            return response.json()
+        except errors.ConflictError:
+            raise
+        except Exception, err:
+            gilliam_errors.convert_error(err)
@@ -12,17 +12,9 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import os
-
-
-def _iter():
-    for fn in os.listdir(os.path.dirname(__file__)):
-        if not fn.endswith('.py'):
-            continue
-        if fn in ('__init__.py',):
-            continue
-        mn, pyext = fn.split('.', 1)
-        yield mn
+# The known service types.  The module of a type is imported when a
+# service of that type is detected.
+SERVICE_TYPES = ('custom', 'etcd')
 
 
 def _import_service(mn):
@@ -39,8 +31,7 @@ def detect(name, defn):
     if name[0] == '_':
         name = name[1:]
 
-    services = list(_iter())
-    if name in services:
+    if name in SERVICE_TYPES:
         return load(name)
 
     if 'script' in defn:
@@ -12,41 +12,35 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from contextlib import contextmanager
-from functools import partial
-from fnmatch import fnmatch
-import hashlib
 import json
 import logging
 import os
-import random
 import sys
-import subprocess
 import time
-import requests
-
-from gilliam import errors
 
+from ..errors import CancelledError
 from ..docker import registry_from_repository, make_repository, DockerAuth
-from .. import scheduler
-
+from ..context import BuildContext, ContextStream, UploadManifest
+from ..buildlog import BuildLog
+from .. import builder, scheduler, trace, util
 
 
-@contextmanager
-def _stream_tarball(dir):
-    options = ['--exclude-vcs', '--exclude-backups']
+def _cancellable(reader, cancel):
+    """Stop reading from `reader` as soon as `cancel` is set."""
+    for data in reader:
+        if cancel is not None and cancel.is_set():
+            break
+        yield data
 
-    ignore = os.path.join(dir, '.gilliam/ignore')
-    if os.path.exists(ignore):
-        options.extend(['-X', ignore])
 
-    popen = subprocess.Popen(['tar', '-c']
-                             + options
-                             + ['-C', dir, '.'],
-                             bufsize=4096,
-                             stdout=subprocess.PIPE)
-    yield popen
-    popen.wait()
+def _close(iterator):
+    """Close the generator `iterator`, unless another thread is in
+    the middle of reading from it.
+    """
+    try:
+        iterator.close()
+    except ValueError:
+        pass
 
 
 def _stream_output(build, outfile):
@@ -58,75 +52,9 @@ def _stream_output(build, outfile):
     t.start()
 
 
-_EXCLUDE_DIRS = ['CVS', 'RCS', 'SCCS', '.git',
-                 '.svn', '.arch-ids', '{arch}',
-                 '.bzr', '.hg', '_darcs']
-_EXCLUDE_FILES = ['.gitignore', '.cvsignore',
-                  '.hgignore', '.bzrignore',
-                  'gilliam.yml', '.#*', '*~', '#*#']
-
-def _filter(names, patterns):
-    def it():
-        for name in names:
-            for pattern in patterns:
-                if fnmatch(name, pattern) or name == pattern:
-                    break
-            else:
-                yield name
-    return list(it())
-
-
-def read_ignore_patterns(dir, filename='.gilliam/ignore'):
-    """Read content of the **ignore** file.  The file contains
-    patterns, that if they match a file or directory, means that the
-    subject should not be included in the data that will be sent to
-    the build server.
-
-    :param extras: a list of extra patterns.
-    """
-    path = os.path.join(dir, filename)
-    if not os.path.exists(path):
-        return []
-    
-    with open(path) as fp:
-        return [line for line in fp
-                if line and not line.startswith("#")]
-
-
 def _compute_tag(dir):
-    """Compute tag."""
-    patterns = read_ignore_patterns(dir)
-    patterns.extend(_EXCLUDE_DIRS)
-    patterns.extend(_EXCLUDE_FILES)
-
-    h = hashlib.md5()
-    for (dirpath, dirnames, filenames) in os.walk(dir):
-        dirnames[:] = _filter(dirnames, patterns)
-        h.update(dirpath)
-        for filename in _filter(filenames, patterns):
-            h.update(filename)
-            path = os.path.join(dir, dirpath, filename)
-            with open(path, 'r') as fp:
-                for data in iter(partial(fp.read, 4096), ''):
-                    h.update(data)
-    return h.hexdigest()
-
-
-class LogFile(object):
-    pending = ''
-
-    def __init__(self, log, indent):
-        self.log = log
-        self.indent = indent
-
-    def write(self, data):
-        data = self.pending + data
-        self.pending = ''
-        lines = data.splitlines(True)
-        if lines[-1][-1] != '\n':
-            self.pending = lines.pop()
-        for line in lines:
-            self.log.info(self.indent + line[:-1])
+    """Compute tag of the build context in `dir`."""
+    return BuildContext.make(dir).tag()
 
 
 class Service(object):
@@ -139,71 +67,278 @@ class Service(object):
         self.name = name
         self.defn = defn
         self.time = time
+        self.skipped = False
 
     def _select_executor(self, config):
         alts = config.service_registry.query_formation('executor')
-        alt = random.choice([d for (k, d) in alts])
+        self.executor_instance = config.placement.select(
+            self.name, [d for (k, d) in alts])
         return config.executor('%s.api.executor.service' % (
-                alt['instance'],))
+                self.executor_instance['instance'],))
 
-    def build(self, config, push_images=True, **options):
+    def _image_exists(self, config, current, check_registry,
+                      push_images):
+        """Check if an image with the computed tag already exists,
+        either in the `current` release or, if `check_registry` is
+        true, in the registry.
+
+        Releases created with `--no-push` list images that never
+        reached the registry, so if images are pushed, an image of
+        the `current` release only counts once the registry has it.
+        """
+        image = '%s:%s' % (self.repository, self.tag)
+        if current is not None:
+            images = set(service.get('image') for service
+                         in current['services'].values())
+            if image in images:
+                if not push_images:
+                    return True
+                check_registry = True
+        if check_registry:
+            auth = self._check_credentials(config)
+            return DockerAuth(config.httpclient).has_image(
+                self.repository, self.tag, auth)
+        return False
+
+    def build(self, config, push_images=True, cancel=None, parallel=False,
+              current=None, check_registry=False, rebuild=False,
+              compression=None, compression_level=None, delta=False,
+              build_log_dir=None, build_log_format=None, **options):
         """Build the service and return its release definition.
 
         :param bool push_images: If True, check credentials against
             registry since the built image will be pushed.
+
+        :param cancel: (Optional) `threading.Event` that is set when
+            the build should be aborted.
+
+        :param bool parallel: If True, other services are built at the
+            same time, so prefix build output with the service name.
+
+        :param current: (Optional) The current release.  If it already
+            holds an image with the same tag, the build is skipped.
+
+        :param bool check_registry: If True, also skip the build if
+            the registry already has an image with the same tag.
+
+        :param bool rebuild: If True, always build the image.
+
+        The remaining options override the stage variables of the same
+        name, with `compression` for `context_compression` and `delta`
+        for `context_delta`.
         """
-        self.executor = self._select_executor(config)
-        builder = config.builder(self.executor)
+        stage_config = config.stage_config
+        self.compression = compression or stage_config.context_compression
+        self.compression_level = (
+            stage_config.context_compression_level
+            if compression_level is None else compression_level)
+        self.delta = delta or stage_config.context_delta
         approot = os.path.join(config.project_dir, self.defn.get('approot', '.'))
 
-        if push_images:
-            self.credentials = self._check_credentials(config)
-
         image = '%s-%s' % (config.formation, self.name)
         self.repository = make_repository(config, image)
-        self.tag = _compute_tag(approot)
+        with trace.span('hash context', service=self.name):
+            context = BuildContext.make(approot)
+            self.tag = context.tag()
+        image = '%s:%s' % (self.repository, self.tag)
+
+        self.skipped = (not rebuild and self._image_exists(
+                config, current, check_registry, push_images))
+        if self.skipped:
+            self.log.info("service '{0}' is up to date ({1})".format(
+                    self.name, image))
+            return scheduler.make_service(image, self.defn.get('script'),
+                self.defn.get('ports', []))
+
+        self.executor = self._select_executor(config)
+        self._check_builder()
 
+        if push_images:
+            self.credentials = self._check_credentials(config)
+
+        indent = '[%s] | ' % (self.name,) if parallel else ' | '
+        output = self._build_log(
+            config, indent, build_log_dir or stage_config.build_log_dir,
+            build_log_format or stage_config.build_log_format)
         self.log.info("start building service '{0}' ...".format(self.name))
-        with _stream_tarball(approot) as process:
-            reader = iter(partial(process.stdout.read, self._CHUNK_SIZE), '')
-            exit_code = builder.build(
-                self.repository, self.tag, reader, LogFile(self.log, ' | '))
+        manifest = UploadManifest.make(approot, self.name)
+        try:
+            with trace.span('build', service=self.name,
+                            executor=self.executor_instance['instance']):
+                exit_code = self._build(config, context, output, cancel,
+                                        manifest)
+        finally:
+            output.close()
 
+        if cancel is not None and cancel.is_set():
+            raise CancelledError(self.name)
         if exit_code:
+            for line in output.tail():
+                self.log.error(indent + line)
             sys.exit("[%s] build failed: %d" % (self.name, exit_code,))
 
         self.log.debug("build successful!")
+        manifest.write(self.tag, context.digests)
+        config.placement.built(self.name, self.executor_instance)
 
-        image = '%s:%s' % (self.repository, self.tag)
         return scheduler.make_service(image, self.defn.get('script'),
             self.defn.get('ports', []))
 
-    def commit(self, config, push_images=True, **options):
-        """Commit the build of the service."""
-        if not push_images:
+    def _check_builder(self):
+        """Turn off the context features that the builder of the
+        selected executor does not advertise.
+        """
+        if self.delta and not builder.supports(self.executor_instance,
+                                               builder.CAP_DELTA):
+            self.log.info("[{0}] builder on {1} does not take delta "
+                          "contexts; sending everything".format(
+                    self.name, self.executor_instance['instance']))
+            self.delta = False
+        if (self.compression not in (None, 'none')
+                and not builder.supports(
+                    self.executor_instance,
+                    builder.compression_capability(self.compression))):
+            self.log.info("[{0}] builder on {1} does not take {2} "
+                          "contexts; sending it uncompressed".format(
+                    self.name, self.executor_instance['instance'],
+                    self.compression))
+            self.compression = None
+
+    def _build(self, config, context, output, cancel, manifest):
+        """Upload the build context, if enabled only the changes since
+        the upload of `manifest`, and return the exit code of the
+        builder.
+        """
+        if self.delta and manifest.tag:
+            exit_code = self._upload(config, context, output, cancel,
+                                     manifest)
+            if (exit_code != builder.EX_NOBASE
+                    or cancel is not None and cancel.is_set()):
+                return exit_code
+            self.log.info("[{0}] builder does not have the base "
+                          "context; sending everything".format(
+                    self.name))
+        return self._upload(config, context, output, cancel)
+
+    def _build_log(self, config, indent, log_dir, log_format):
+        """Create the log that build output is written to."""
+        stage_config = config.stage_config
+        level = logging.getLevelName(stage_config.build_log_level.upper())
+        if not isinstance(level, int):
+            sys.exit("unknown build log level: %s" % (
+                    stage_config.build_log_level,))
+        try:
+            return BuildLog.make(self.log, indent, self.name, level,
+                                 log_dir, log_format,
+                                 stage_config.build_log_tail)
+        except ValueError as err:
+            sys.exit(str(err))
+
+    def _upload(self, config, context, output, cancel, manifest=None):
+        """Upload the build context to the builder and wait for the
+        build to finish.
+
+        If `manifest` is given, only files that changed since that
+        upload are sent, together with a list of removed files.  The
+        builder is told to apply them on top of the image of that
+        upload.
+
+        :returns: The exit code of the builder.
+        """
+        env, only, extra = {}, None, ()
+        if manifest is not None:
+            only, deleted = context.delta(manifest)
+            base = '%s:%s' % (self.repository, manifest.tag)
+            env['GILLIAM_CONTEXT_BASE'] = base
+            extra = [(builder.DELTA_PATH, json.dumps(
+                        {'base': base, 'deleted': deleted}))]
+            self.log.info("[{0}] sending {1} changed and {2} removed "
+                          "files on top of {3}".format(
+                    self.name, len(only), len(deleted), base))
+
+        tar = trace.iterate('tar context',
+                            context.stream(self._CHUNK_SIZE, only, extra),
+                            service=self.name)
+        try:
+            stream = ContextStream(
+                _cancellable(tar, cancel),
+                self.compression, self.compression_level)
+        except ValueError as err:
+            sys.exit("[%s] %s" % (self.name, err))
+        env['GILLIAM_CONTEXT_COMPRESSION'] = stream.codec
+
+        upload = trace.iterate('upload context', stream,
+                               service=self.name, codec=stream.codec)
+        try:
+            exit_code = builder.build(
+                self.executor, self.repository, self.tag, upload,
+                output, context=context, env=env, cancel=cancel)
+        except builder.ContextChangedError as err:
+            sys.exit("[%s] files changed during upload: %s" % (
+                    self.name, err))
+        finally:
+            # the builder might not have read all of the context;
+            # closing ends the spans of the upload.
+            _close(upload)
+            _close(tar)
+        self._log_upload(stream)
+        return exit_code
+
+    def _log_upload(self, stream):
+        rate = stream.wire_bytes / stream.elapsed if stream.elapsed else 0
+        self.log.info("[{0}] context {1}, {2} sent ({3}) in {4:.1f}s "
+                      "({5}/s)".format(
+                self.name, util.format_size(stream.raw_bytes),
+                util.format_size(stream.wire_bytes), stream.codec,
+                stream.elapsed, util.format_size(rate)))
+
+    def commit(self, config, push_images=True, parallel=False, **options):
+        """Commit the build of the service.
+
+        :param bool parallel: If True, other images are pushed at the
+            same time, so log status changes prefixed with the service
+            name instead of drawing a progress line.
+        """
+        if not push_images or self.skipped:
             return
 
         t0 = self.time.time()
         self.log.info("start pushing image {0}:".format(self.repository))
         try:
-            CLEAR = '\033[K'
-            try:
-                for doc in self.executor.push_image(self.repository, self.credentials):
-                    if not 'status' in doc:
-                        sys.stdout.write("\n")
-                    elif 'progress' in doc:
-                        sys.stdout.write("\r{0}{1} [{2}]".format(
-                                CLEAR, doc['status'], doc['progress']))
-                    else:
-                        sys.stdout.write("\r{0}{1}".format(CLEAR, doc['status']))
-                    sys.stdout.flush()
-            except errors.GilliamError:
-                raise
+            with trace.span('push', service=self.name,
+                            executor=self.executor_instance['instance']):
+                status = self.executor.push_image(self.repository,
+                                                  self.credentials)
+                if parallel:
+                    self._log_push_status(status)
+                else:
+                    self._print_push_status(status)
         finally:
-            sys.stdout.write("\n")
             t1 = self.time.time()
             self.log.info("done (time {0}s)".format(t1 - t0))
 
+    def _print_push_status(self, status):
+        CLEAR = '\033[K'
+        try:
+            for doc in status:
+                if not 'status' in doc:
+                    sys.stdout.write("\n")
+                elif 'progress' in doc:
+                    sys.stdout.write("\r{0}{1} [{2}]".format(
+                            CLEAR, doc['status'], doc['progress']))
+                else:
+                    sys.stdout.write("\r{0}{1}".format(CLEAR, doc['status']))
+                sys.stdout.flush()
+        finally:
+            sys.stdout.write("\n")
+
+    def _log_push_status(self, status):
+        last = None
+        for doc in status:
+            if doc.get('status') and doc['status'] != last:
+                last = doc['status']
+                self.log.info("[{0}] {1}".format(self.name, last))
+
     def _check_credentials(self, config):
         """Check that the user has authenticated with the
         registry/index that will hold the image.
@@ -211,22 +346,7 @@ class Service(object):
         Return an access token that will be passed to the executor
         when it commits and pushes the image.
         """
-        docker_auth = DockerAuth(requests)
-
         registry = registry_from_repository(config.stage_config.repository)
-        cred = config.auth_config.get(registry)
-
-        if docker_auth.anonymous(registry):
-            return None
-
-        if not cred:
-            raise Exception("need to authenticate with %s" % (
-                    registry,))
-
-        authcfg = docker_auth.check(registry, cred.username,
-                                    cred.password)
-        if not authcfg:
-            raise Exception("need to authenticate with %s" % (
-                    registry,))
-
-        return authcfg
+        with trace.span('check credentials', service=self.name,
+                        registry=registry):
+            return config.registry_auth.check(registry)
@@ -0,0 +1,108 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Profiling of the startup of the command-line tool.
+
+When enabled, every import of a module that is not already loaded is
+timed, and so are the steps that are wrapped in `timed`::
+
+   >>> startup.enable()
+   >>> with startup.timed('read stage config'):
+   ...     stage_config = StageConfig.make(stage)
+   >>> startup.report(sys.stderr)
+
+Times of imports are inclusive of the modules that they import in
+turn; the report also shows the time spent in the module itself.
+"""
+
+from contextlib import contextmanager
+import __builtin__
+import sys
+import time
+
+
+_enabled = False
+_t0 = None
+_imports = []
+_steps = []
+_stack = []
+_original_import = __builtin__.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=None,
+                  level=-1):
+    if name in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+    _stack.append(0)
+    loaded = len(sys.modules)
+    t0 = time.time()
+    module = None
+    try:
+        module = _original_import(name, globals, locals, fromlist, level)
+        return module
+    finally:
+        elapsed = time.time() - t0
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += elapsed
+        if len(sys.modules) > loaded:
+            # relative imports are reported with the full name.
+            if module is not None and (fromlist or '.' not in name):
+                name = module.__name__
+            _imports.append((name, elapsed, elapsed - children))
+
+
+def enable():
+    """Start timing imports and steps."""
+    global _enabled, _t0
+    _enabled = True
+    _t0 = time.time()
+    __builtin__.__import__ = _timed_import
+
+
+def disable():
+    """Stop timing imports."""
+    global _enabled
+    _enabled = False
+    __builtin__.__import__ = _original_import
+
+
+@contextmanager
+def timed(label):
+    """Context manager that records the time spent in the block, if
+    profiling is enabled.
+    """
+    if not _enabled:
+        yield
+        return
+    t0 = time.time()
+    try:
+        yield
+    finally:
+        _steps.append((label, time.time() - t0))
+
+
+def report(fp, limit=20):
+    """Write a breakdown of the startup time to `fp`."""
+    total = time.time() - _t0
+    fp.write("startup: %.1f ms total, %.1f ms in %d imports\n" % (
+            total * 1000, sum(own for (name, elapsed, own) in _imports)
+            * 1000, len(_imports)))
+    fp.write("%9s %9s  %s\n" % ("cumul ms", "self ms", "import"))
+    for (name, elapsed, own) in sorted(
+            _imports, key=lambda i: i[1], reverse=True)[:limit]:
+        fp.write("%9.1f %9.1f  %s\n" % (elapsed * 1000, own * 1000, name))
+    fp.write("%9s %9s  %s\n" % ("ms", "", "step"))
+    for (label, elapsed) in _steps:
+        fp.write("%9.1f %9s  %s\n" % (elapsed * 1000, "", label))
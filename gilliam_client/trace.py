@@ -0,0 +1,158 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Tracing of where the time of a command goes.
+
+Commands that take `--trace FILE` record a span for each phase of
+their work, and write them to `FILE` in the Chrome trace event
+format, which can be loaded in `chrome://tracing` or Perfetto::
+
+   >>> trace.enable()
+   >>> with trace.span('push', service='api'):
+   ...     push()
+   >>> trace.write('deploy.json')
+
+Spans are recorded per thread, and carry the attributes they were
+given together with the peak memory use of the process when they
+ended.  Peak memory comes from `tracemalloc` if it is available, and
+otherwise from the maximum resident set size.
+
+When tracing is not enabled, spans cost next to nothing.
+"""
+
+from contextlib import contextmanager
+import json
+import os
+import threading
+import time
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+_enabled = False
+_t0 = None
+_events = []
+_threads = {}
+
+
+def add_trace_argument(parser):
+    """Add the `--trace FILE` option to `parser`."""
+    parser.add_argument('--trace', metavar='FILE',
+                        help="write a trace of the command to FILE, "
+                        "for chrome://tracing or Perfetto")
+
+
+def enable():
+    """Start recording spans."""
+    global _enabled, _t0
+    _enabled = True
+    _t0 = time.time()
+    if tracemalloc is not None and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def _peak_memory():
+    """Return a dict with the peak memory use of the process in
+    kilobytes.
+    """
+    if tracemalloc is not None and tracemalloc.is_tracing():
+        return {'peak_kb': tracemalloc.get_traced_memory()[1] // 1024}
+    if resource is not None:
+        # kilobytes on Linux, bytes on OS X.
+        return {'maxrss': resource.getrusage(
+                resource.RUSAGE_SELF).ru_maxrss}
+    return {}
+
+
+def add(name, start, duration, **args):
+    """Record a span `name` that started at `start` and lasted for
+    `duration` seconds.
+    """
+    if not _enabled:
+        return
+    thread = threading.current_thread()
+    _threads.setdefault(thread.ident, thread.name)
+    args.update(_peak_memory())
+    _events.append({'name': name, 'ph': 'X', 'pid': os.getpid(),
+                    'tid': thread.ident,
+                    'ts': int((start - _t0) * 1e6),
+                    'dur': int(duration * 1e6),
+                    'args': args})
+
+
+@contextmanager
+def span(name, **args):
+    """Context manager that records the block as a span `name` with
+    attributes `args`.  The block can add attributes to the dict that
+    it is given.
+    """
+    if not _enabled:
+        yield args
+        return
+    t0 = time.time()
+    try:
+        yield args
+    except BaseException as err:
+        args['error'] = repr(err)
+        raise
+    finally:
+        add(name, t0, time.time() - t0, **args)
+
+
+def iterate(name, iterable, **args):
+    """Iterate over `iterable`, recording a span `name` from the first
+    item until it is exhausted.  The span has a `busy_ms` attribute
+    for the time spent producing items.
+    """
+    if not _enabled:
+        for item in iterable:
+            yield item
+        return
+    t0 = time.time()
+    busy, count = 0, 0
+    it = iter(iterable)
+    try:
+        while True:
+            t1 = time.time()
+            try:
+                item = next(it)
+            except StopIteration:
+                break
+            finally:
+                busy += time.time() - t1
+            count += 1
+            yield item
+    finally:
+        add(name, t0, time.time() - t0, busy_ms=int(busy * 1000),
+            items=count, **args)
+
+
+def write(path):
+    """Write the recorded spans to `path` in the Chrome trace event
+    format.
+    """
+    pid = os.getpid()
+    events = [{'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+               'args': {'name': name}} for (tid, name) in _threads.items()]
+    events.extend(sorted(_events, key=lambda e: e['ts']))
+    with open(path, 'w') as fp:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, fp)
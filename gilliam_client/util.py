@@ -13,17 +13,83 @@
 # limitations under the License.
 
 from urlparse import urljoin
+import math
 import os
+import Queue
+import sys
+import threading
+import time
+
+
+_RATE_UNITS = {'s': 1, 'sec': 1, 'm': 60, 'min': 60,
+               'h': 3600, 'hour': 3600}
 
 
 def parse_rate(rate):
-    """Parse rate and return number of seconds to pause between
-    calls to C{scale}.
+    """Parse rate and return the least number of seconds between
+    calls to C{scale} or C{migrate}.
+
+    The rate is either a number of seconds to pause, or a number of
+    calls per unit of time, such as `5/min`.  Units are `s`, `min`
+    and `h`.
+
+    :raises: ValueError if the rate cannot be parsed.
     """
     if not rate:
         return 0
+    if '/' not in rate:
+        return float(rate)
+    count, unit = rate.split('/', 1)
+    count = float(count) if count else 1
+    if unit not in _RATE_UNITS or count <= 0:
+        raise ValueError("bad rate %r" % (rate,))
+    return _RATE_UNITS[unit] / count
+
+
+class Throttle(object):
+    """Keeps steps at least `interval` seconds apart."""
+
+    def __init__(self, interval, clock=time):
+        self.interval = interval
+        self.clock = clock
+        self._last = None
+
+    def wait(self):
+        """Sleep until `interval` seconds have passed since the last
+        step, and start the next one.
+        """
+        if self._last is not None and self.interval:
+            delay = self._last + self.interval - self.clock.time()
+            if delay > 0:
+                self.clock.sleep(delay)
+        self._last = self.clock.time()
+
+
+def parse_budget(budget, total, round_up):
+    """Parse a number of instances that is either absolute, or a
+    percentage (such as `25%`) of `total`.  Percentages are rounded
+    up if `round_up` is true, otherwise down.
+
+    :raises: ValueError if the budget cannot be parsed or is
+        negative.
+    """
+    if not budget.endswith('%'):
+        amount = int(budget)
     else:
-        return 10
+        amount = total * float(budget[:-1]) / 100
+        amount = int(math.ceil(amount) if round_up else math.floor(amount))
+    if amount < 0:
+        raise ValueError("%s: budget cannot be negative" % (budget,))
+    return amount
+
+
+def format_size(size):
+    """Format a number of bytes for humans."""
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            break
+        size /= 1024.0
+    return ('%d %s' if unit == 'B' else '%.1f %s') % (size, unit)
 
 
 def find_rootdir(fn='gilliam.yml'):
@@ -35,16 +101,79 @@ def find_rootdir(fn='gilliam.yml'):
     return None
 
 
-def traverse_collection(httpclient, url):
-    """Traverse a collection, yielding every item."""
-    while True:
-        response = httpclient.get(url)
-        collection = response.json()
-        for item in collection['items']:
-            yield item
-        if not 'next' in collection['links']:
-            break
-        url = urljoin(url, collection['links']['next'])
+def _fetch_page(httpclient, url):
+    """Fetch a page of a collection and return the items and the URL
+    to the next page, or `None` if it is the last page.
+    """
+    response = httpclient.get(url)
+    response.raise_for_status()
+    collection = response.json()
+    if not 'next' in collection['links']:
+        return collection['items'], None
+    return collection['items'], urljoin(url, collection['links']['next'])
+
+
+def _prefetch_pages(httpclient, url, pages, stop):
+    """Fetch pages starting at `url` and put them on the `pages`
+    queue until the last page has been fetched or `stop` is set.
+
+    Every page is put on the queue as a `(items, exc_info)` tuple.
+    The last tuple holds `None` for items.
+    """
+    def put(page):
+        while not stop.is_set():
+            try:
+                pages.put(page, True, 0.1)
+            except Queue.Full:
+                continue
+            else:
+                return True
+        return False
+
+    try:
+        while url is not None:
+            items, url = _fetch_page(httpclient, url)
+            if not put((items, None)):
+                return
+    except Exception:
+        put((None, sys.exc_info()))
+    else:
+        put((None, None))
+
+
+def traverse_collection(httpclient, url, prefetch=0):
+    """Traverse a collection, yielding every item.
+
+    :param prefetch: (Optional) Number of pages to fetch ahead of the
+        consumer in a background thread.  If zero, every page is
+        fetched when the consumer asks for its first item.
+    """
+    if prefetch < 1:
+        while url is not None:
+            items, url = _fetch_page(httpclient, url)
+            for item in items:
+                yield item
+        return
+
+    pages = Queue.Queue(prefetch)
+    stop = threading.Event()
+    thread = threading.Thread(target=_prefetch_pages,
+                              args=(httpclient, url, pages, stop))
+    thread.daemon = True
+    thread.start()
+    try:
+        while True:
+            items, exc_info = pages.get(True, 2**31)
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            if items is None:
+                break
+            for item in items:
+                yield item
+    finally:
+        # the consumer might have stopped early; tell the worker to
+        # stop fetching pages.
+        stop.set()
 
 
 def last(it, default=None):
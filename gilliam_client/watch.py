@@ -0,0 +1,249 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Waiting for the instances of a formation to reach a state.
+
+The scheduler pushes changes to instances over a websocket.  The
+watch keeps a view of all instances of the formation up to date from
+that stream, and checks a predicate against it after every change::
+
+   >>> watch = InstanceWatch(scheduler, 'my-formation')
+   >>> watch.wait(migrated('12'), timeout=60)
+   True
+
+If the scheduler does not offer the stream, or it breaks, the watch
+falls back to polling the instance collection.
+"""
+
+import json
+import logging
+import time
+
+from gilliam.packages import websocket
+
+
+log = logging.getLogger(__name__)
+
+# states an instance can stay in; anything else is on its way
+# somewhere.
+_SETTLED_STATES = ('running', 'terminated', 'stopped', 'failed')
+
+# states of instances that are gone.
+_FINAL_STATES = ('terminated', 'stopped', 'failed', 'removed')
+
+# how long to wait for more changes when catching up on the stream.
+_DRAIN_TIMEOUT = 0.05
+
+
+def is_live(instance):
+    """Return true if `instance` has not gone away."""
+    return instance.get('state') not in _FINAL_STATES
+
+
+def converged(instances):
+    """Predicate that is true when no instance is changing state."""
+    return all(instance.get('state') in _SETTLED_STATES
+               for instance in instances.values())
+
+
+def migrated(release):
+    """Return a predicate that is true when every live instance is
+    running and belongs to `release`.  Instances that are not part of
+    any release (spawned by hand) are not migrated, and are ignored.
+    """
+    def predicate(instances):
+        return all(instance.get('release') == release
+                   and instance.get('state') == 'running'
+                   for instance in instances.values()
+                   if is_live(instance)
+                   and instance.get('release') is not None)
+    return predicate
+
+
+def _states(instances):
+    return dict((name, (instance.get('release'), instance.get('state')))
+                for (name, instance) in instances.items())
+
+
+def changed(before):
+    """Return a predicate that is true when the instances differ from
+    `before`, as returned by `InstanceWatch.snapshot`, and no instance
+    is changing state.
+    """
+    states = _states(before)
+
+    def predicate(instances):
+        return _states(instances) != states and converged(instances)
+    return predicate
+
+
+def scaled(release, scales):
+    """Return a predicate that is true when the services of `release`
+    has exactly the number of running instances given by `scales`.
+    """
+    def predicate(instances):
+        running = {}
+        for instance in instances.values():
+            if (instance.get('release') == release
+                    and instance.get('state') == 'running'):
+                service = instance.get('service')
+                running[service] = running.get(service, 0) + 1
+        return all(running.get(service, 0) == num
+                   for (service, num) in scales.items())
+    return predicate
+
+
+class InstanceWatch(object):
+    """View of the instances of `formation`, kept up to date by
+    changes pushed from the scheduler or, failing that, by polling.
+
+    :param poll_interval: Tuple of the first and the longest interval
+        between polls, in seconds.
+    """
+
+    def __init__(self, scheduler, formation, clock=time,
+                 poll_interval=(1, 5)):
+        self.scheduler = scheduler
+        self.formation = formation
+        self.clock = clock
+        self.poll_interval = poll_interval
+        self.instances = {}
+        self._stream = None
+        self._streaming = True
+
+    def _refresh(self):
+        self.instances = dict(
+            (instance['name'], instance) for instance
+            in self.scheduler.instances(self.formation))
+
+    def _open(self):
+        """Try to open the change stream.  Return `False` if the
+        scheduler does not support it.
+        """
+        try:
+            self._stream = self.scheduler.watch_instances(self.formation)
+        except Exception:
+            log.debug("cannot watch instances; polling instead",
+                      exc_info=True)
+            self._streaming = False
+            return False
+        return True
+
+    def _close(self):
+        if self._stream is not None:
+            try:
+                self._stream.close()
+            except Exception:
+                pass
+            self._stream = None
+
+    def _apply(self, data):
+        instance = json.loads(data)
+        if instance.get('state') == 'removed':
+            self.instances.pop(instance['name'], None)
+        else:
+            self.instances[instance['name']] = instance
+
+    def _remaining(self, deadline):
+        if deadline is None:
+            return None
+        return max(0, deadline - self.clock.time())
+
+    def _recv(self, timeout):
+        """Receive a change from the stream and apply it.  Return
+        `False` on timeout, and `None` if the stream broke.
+        """
+        self._stream.settimeout(timeout)
+        try:
+            data = self._stream.recv()
+        except websocket.WebSocketTimeoutException:
+            return False
+        except Exception:
+            log.debug("instance stream broke; polling instead",
+                      exc_info=True)
+            self._close()
+            self._streaming = False
+            return None
+        if data:
+            self._apply(data)
+        return True
+
+    def _wait_stream(self, predicate, deadline, refresh):
+        """Wait for changes on the stream.  Returns `True` or `False`
+        like `wait`, or `None` if the stream broke.
+        """
+        # catch up on changes that were pushed since the last wait.
+        while True:
+            result = self._recv(_DRAIN_TIMEOUT)
+            if result is None:
+                return None
+            if not result:
+                break
+        if refresh:
+            self._refresh()
+        while not predicate(self.instances):
+            remaining = self._remaining(deadline)
+            if remaining == 0:
+                return False
+            result = self._recv(remaining)
+            if not result:
+                return result
+        return True
+
+    def _wait_poll(self, predicate, deadline):
+        interval, max_interval = self.poll_interval
+        while True:
+            self._refresh()
+            if predicate(self.instances):
+                return True
+            remaining = self._remaining(deadline)
+            if remaining == 0:
+                return False
+            self.clock.sleep(interval if remaining is None else
+                             min(interval, remaining))
+            interval = min(interval * 2, max_interval)
+
+    def wait(self, predicate, timeout=None, refresh=False):
+        """Wait until `predicate`, called with a dict of the instances
+        keyed by name, returns true.
+
+        :param refresh: If true, list the instances again before the
+            predicate is checked.  Use this after a call that changes
+            instances, since the stream might not have delivered the
+            changes yet.
+
+        :returns: `False` if `timeout` seconds passed first, otherwise
+            `True`.
+        """
+        deadline = (self.clock.time() + timeout if timeout is not None
+                    else None)
+        if self._streaming and self._stream is None and self._open():
+            # the stream is opened before the instances are listed,
+            # so that no change falls between the two.
+            self._refresh()
+            refresh = False
+        if self._stream is not None:
+            result = self._wait_stream(predicate, deadline, refresh)
+            if result is not None:
+                return result
+        return self._wait_poll(predicate, deadline)
+
+    def snapshot(self):
+        """Bring the view up to date and return a copy of it."""
+        self.wait(lambda instances: True, 0)
+        return dict(self.instances)
+
+    def close(self):
+        """Close the change stream."""
+        self._close()
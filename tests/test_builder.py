@@ -0,0 +1,217 @@
+# Copyright 2013 Johan Rydberg.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Uploads of build contexts to a stand-in builder.
+
+The stand-in executor runs a builder that unpacks the uploaded
+tarball into an "image", a dict of paths to contents, and commits it
+under the tag it is given.  If it advertises `context-delta`, it
+follows the contract in `gilliam_client.builder`; otherwise it builds
+whatever it is sent, like a stock builder.  It only decompresses the
+context with the codecs that it advertises.
+"""
+
+import bz2
+import json
+import os
+import shutil
+import tarfile
+import tempfile
+import threading
+import unittest
+import zlib
+from cStringIO import StringIO
+
+from gilliam_client import builder
+from gilliam_client.context import BuildContext, UploadManifest
+from gilliam_client.services.custom import Service
+
+
+def _decompress(data, codec):
+    if codec == 'gzip':
+        return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+    elif codec == 'bz2':
+        return bz2.decompress(data)
+    return data
+
+
+class StandInProcess(object):
+
+    def __init__(self, executor, env):
+        self.executor = executor
+        self.env = env
+        self.files = None
+        self._attached = threading.Event()
+
+    def attach(self, infile, output):
+        self.data = ''.join(infile)
+        self._attached.set()
+
+    def _unpack(self):
+        codec = self.env.get('GILLIAM_CONTEXT_COMPRESSION')
+        data = (_decompress(self.data, codec)
+                if codec in self.executor.codecs else self.data)
+        files = {}
+        with tarfile.open(fileobj=StringIO(data)) as tar:
+            for member in tar:
+                if member.isfile():
+                    files[os.path.normpath(member.name)] = tar.extractfile(
+                        member).read()
+        return files
+
+    def wait(self):
+        self._attached.wait()
+        files = self._unpack()
+        base = self.env.get('GILLIAM_CONTEXT_BASE')
+        if base is not None and self.executor.delta:
+            if base not in self.executor.images:
+                return builder.EX_NOBASE
+            delta = json.loads(files.pop(builder.DELTA_PATH))
+            image = dict(self.executor.images[base])
+            for relpath in delta['deleted']:
+                image.pop(relpath, None)
+            image.update(files)
+            files = image
+        self.files = files
+        return 0
+
+    def commit(self, repository, tag):
+        self.executor.images['%s:%s' % (repository, tag)] = self.files
+
+
+class StandInExecutor(object):
+
+    def __init__(self, delta=False, codecs=()):
+        self.delta = delta
+        self.codecs = codecs
+        self.images = {}
+        self.runs = []
+
+    def run(self, formation, image, env, command):
+        process = StandInProcess(self, env)
+        self.runs.append(process)
+        return process
+
+    def instance(self):
+        """Return the service registry entry of the executor."""
+        capabilities = [builder.compression_capability(codec)
+                        for codec in self.codecs]
+        if self.delta:
+            capabilities.append(builder.CAP_DELTA)
+        return {'instance': 'executor-1', 'capabilities': capabilities}
+
+
+class UploadTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.approot = tempfile.mkdtemp()
+        self.write('app.py', 'print "hello"\n')
+        self.write('lib/util.py', 'x = 1\n')
+        self.write('README', 'readme\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.approot)
+
+    def write(self, relpath, data):
+        path = os.path.join(self.approot, relpath)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'w') as fp:
+            fp.write(data)
+
+    def build(self, executor, delta=True, compression=None):
+        """Build the application root on `executor` the way
+        `Service.build` does, and return the committed image.
+        """
+        service = Service('web', {})
+        service.repository = 'repo'
+        service.compression = compression
+        service.compression_level = None
+        service.delta = delta
+        service.executor = executor
+        service.executor_instance = executor.instance()
+        service._check_builder()
+        context = BuildContext.make(self.approot)
+        service.tag = context.tag()
+        manifest = UploadManifest.make(self.approot, 'web')
+        exit_code = service._build(None, context, StringIO(), None,
+                                   manifest)
+        self.assertEqual(exit_code, 0)
+        manifest.write(service.tag, context.digests)
+        return executor.images['repo:%s' % (service.tag,)]
+
+    def expected(self):
+        return {'app.py': 'print "hello"\n', 'lib/util.py': 'x = 2\n'}
+
+    def change(self):
+        self.write('lib/util.py', 'x = 2\n')
+        os.remove(os.path.join(self.approot, 'README'))
+
+
+class DeltaUploadTest(UploadTestCase):
+
+    def test_delta(self):
+        executor = StandInExecutor(delta=True)
+        self.build(executor)
+        self.change()
+        image = self.build(executor)
+        self.assertEqual(image, self.expected())
+        self.assertEqual(len(executor.runs), 2)
+        delta = executor.runs[-1]
+        self.assertIn('GILLIAM_CONTEXT_BASE', delta.env)
+        self.assertNotIn('./app.py', tarfile.open(
+                fileobj=StringIO(delta.data)).getnames())
+
+    def test_fallback_without_base(self):
+        self.build(StandInExecutor(delta=True))
+        self.change()
+        # another executor, that does not have the previous image.
+        executor = StandInExecutor(delta=True)
+        image = self.build(executor)
+        self.assertEqual(image, self.expected())
+        self.assertEqual(len(executor.runs), 2)
+        self.assertNotIn('GILLIAM_CONTEXT_BASE', executor.runs[-1].env)
+
+    def test_full_upload_without_capability(self):
+        executor = StandInExecutor(delta=False)
+        self.build(executor)
+        self.change()
+        image = self.build(executor)
+        self.assertEqual(image, self.expected())
+        self.assertEqual(len(executor.runs), 2)
+        for process in executor.runs:
+            self.assertNotIn('GILLIAM_CONTEXT_BASE', process.env)
+
+
+class CompressedUploadTest(UploadTestCase):
+
+    def test_compressed(self):
+        executor = StandInExecutor(codecs=('gzip',))
+        self.change()
+        image = self.build(executor, delta=False, compression='gzip')
+        self.assertEqual(image, self.expected())
+        self.assertEqual(executor.runs[-1].env[
+                'GILLIAM_CONTEXT_COMPRESSION'], 'gzip')
+
+    def test_uncompressed_without_capability(self):
+        executor = StandInExecutor(codecs=('bz2',))
+        self.change()
+        image = self.build(executor, delta=False, compression='gzip')
+        self.assertEqual(image, self.expected())
+        self.assertEqual(executor.runs[-1].env[
+                'GILLIAM_CONTEXT_COMPRESSION'], 'none')
+
+
+if __name__ == '__main__':
+    unittest.main()